@@ -12,6 +12,13 @@ Funcionalidades:
 - Creación de perfiles de cargo
 - Análisis de brechas de competencias
 - Planes de carrera
+- Simulación de escenarios de costo de planilla
+- Bitácora de auditoría de cálculos
+- Conciliación de liquidaciones entre períodos
+- Procesamiento paralelo de nóminas multiempresa
+- Horas extra desde marcaciones de asistencia
+- Vistas paginadas de resultados extensos
+- Reportes PDF de finiquitos (individuales y en lote) y planes de carrera
 
 Autor: MiniMax Agent
 Versión: 2025.11.29
@@ -20,9 +27,35 @@ Versión: 2025.11.29
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import os
 import json
+import re
+import hashlib
+import logging
 import io
+import time
+import uuid
+import queue
+import atexit
+import tempfile
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import inspect
+import numbers
+import functools
+import threading
+import sys
+from array import array
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from types import MappingProxyType
+from pandas.tseries.api import guess_datetime_format
 import base64
 from fpdf import FPDF
 from docx import Document
@@ -82,53 +115,639 @@ IND = {
     'utm': 69542.0,
     'imm': 530000,
     'tope_indemnizacion': 90,
-    'tope_gratificacion': 4.75
+    'tope_gratificacion': 4.75,
+    'tope_imponible_uf': 87.8,
+    'jornada_semanal': 42
 }
 
-COMPETENCIAS_BASE = {
-    "Administración": {
-        "técnicas": {
-            "Contabilidad": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Administración": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Excel": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Análisis Financiero": ["Básico", "Intermedio", "Avanzado", "Experto"]
-        },
-        "blandas": {
-            "Comunicación": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Liderazgo": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Análisis": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Organización": ["Básico", "Intermedio", "Avanzado", "Experto"]
-        }
-    },
-    "Tecnología": {
-        "técnicas": {
-            "Programación": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Bases de Datos": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Redes": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Cybersecurity": ["Básico", "Intermedio", "Avanzado", "Experto"]
-        },
-        "blandas": {
-            "Resolución Problemas": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Innovación": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Trabajo Equipo": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Adaptabilidad": ["Básico", "Intermedio", "Avanzado", "Experto"]
-        }
-    },
-    "Operaciones": {
-        "técnicas": {
-            "Gestión Operaciones": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Procesos": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Logística": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Control Calidad": ["Básico", "Intermedio", "Avanzado", "Experto"]
-        },
-        "blandas": {
-            "Planificación": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Organización": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Orientación Resultados": ["Básico", "Intermedio", "Avanzado", "Experto"],
-            "Negociación": ["Básico", "Intermedio", "Avanzado", "Experto"]
-        }
-    }
-}
+# Catálogo de competencias
+COMPETENCIAS_ARCHIVO = os.environ.get(
+    'HR_COMPETENCIAS_ARCHIVO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'competencias.json'))
+
+class CatalogoCompetencias:
+    """Catálogo inmutable de competencias con niveles como códigos enteros"""
+    
+    __slots__ = ('niveles', 'areas', 'tipos', 'nombres', '_codigo_nivel', '_area', '_tipo',
+                 '_nivel_min', '_nivel_max', '_tipos_por_area', '_por_area_tipo', '_posicion')
+    
+    def __init__(self, niveles, areas):
+        asignar = functools.partial(object.__setattr__, self)
+        asignar('niveles', tuple(sys.intern(n) for n in niveles))
+        asignar('_codigo_nivel', MappingProxyType({nivel: codigo for codigo, nivel in enumerate(self.niveles)}))
+        asignar('areas', tuple(sys.intern(a) for a in areas))
+        asignar('tipos', tuple(dict.fromkeys(sys.intern(t) for tipos in areas.values() for t in tipos)))
+        
+        nombres, area, tipo, nivel_min, nivel_max = [], array('B'), array('B'), array('B'), array('B')
+        por_area_tipo, posicion = {}, {}
+        for codigo_area, nombre_area in enumerate(self.areas):
+            for nombre_tipo, competencias in areas[nombre_area].items():
+                nombre_tipo = sys.intern(nombre_tipo)
+                lista = []
+                for competencia in competencias:
+                    # Una competencia es un nombre o {"nombre", "nivel_min", "nivel_max"}
+                    if isinstance(competencia, str):
+                        competencia = {'nombre': competencia}
+                    nombre = sys.intern(competencia['nombre'])
+                    posicion[(nombre_area, nombre_tipo, nombre)] = len(nombres)
+                    lista.append(nombre)
+                    nombres.append(nombre)
+                    area.append(codigo_area)
+                    tipo.append(self.tipos.index(nombre_tipo))
+                    nivel_min.append(self._codigo_nivel[competencia.get('nivel_min', self.niveles[0])])
+                    nivel_max.append(self._codigo_nivel[competencia.get('nivel_max', self.niveles[-1])])
+                por_area_tipo[(nombre_area, nombre_tipo)] = tuple(lista)
+        
+        asignar('nombres', tuple(nombres))
+        asignar('_area', area)
+        asignar('_tipo', tipo)
+        asignar('_nivel_min', nivel_min)
+        asignar('_nivel_max', nivel_max)
+        asignar('_tipos_por_area', MappingProxyType({
+            a: tuple(t for t in self.tipos if (a, t) in por_area_tipo) for a in self.areas}))
+        asignar('_por_area_tipo', MappingProxyType(por_area_tipo))
+        asignar('_posicion', MappingProxyType(posicion))
+    
+    def __setattr__(self, nombre, valor):
+        raise AttributeError("CatalogoCompetencias es inmutable")
+    
+    def __len__(self):
+        return len(self.nombres)
+    
+    @classmethod
+    def desde_archivo(cls, ruta=COMPETENCIAS_ARCHIVO):
+        """Construir el catálogo desde un archivo JSON local"""
+        with open(ruta, encoding='utf-8') as archivo:
+            datos = json.load(archivo)
+        return cls(datos['niveles'], datos['areas'])
+    
+    def tipos_de(self, area):
+        """Tipos de competencia definidos para un área"""
+        return self._tipos_por_area.get(area, ())
+    
+    def competencias(self, area, tipo):
+        """Nombres de las competencias de un área y tipo"""
+        return self._por_area_tipo.get((area, tipo), ())
+    
+    def niveles_de(self, area, tipo, competencia):
+        """Niveles válidos para una competencia"""
+        posicion = self._posicion[(area, tipo, competencia)]
+        return self.niveles[self._nivel_min[posicion]:self._nivel_max[posicion] + 1]
+    
+    def codigo_nivel(self, nivel):
+        """Código entero de un nivel (Básico = 0)"""
+        return self._codigo_nivel[nivel]
+    
+    def rangos_nivel(self):
+        """Códigos de nivel mínimo y máximo de cada competencia, en orden de catálogo"""
+        return np.frombuffer(self._nivel_min, dtype=np.uint8), np.frombuffer(self._nivel_max, dtype=np.uint8)
+    
+    def a_perfil(self, codigos):
+        """Convertir un código de nivel por competencia al dict anidado área > tipo > competencia"""
+        perfil = {}
+        for (area, tipo), nombres in self._por_area_tipo.items():
+            perfil.setdefault(area, {})[tipo] = {
+                nombre: self.niveles[codigos[self._posicion[(area, tipo, nombre)]]] for nombre in nombres
+            }
+        return perfil
+
+@st.cache_resource
+def cargar_catalogo_competencias(ruta=COMPETENCIAS_ARCHIVO):
+    """Catálogo de competencias, leído una sola vez por proceso"""
+    return CatalogoCompetencias.desde_archivo(ruta)
+
+
+# Caché de resultados
+CACHE_MAX_ENTRADAS = 1024
+CACHE_TTL_SEGUNDOS = 600
+
+class CacheResultados:
+    """Caché LRU acotada por tamaño y TTL, compartida por todo el proceso"""
+    
+    def __init__(self, max_entradas=CACHE_MAX_ENTRADAS, ttl_segundos=CACHE_TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.expirados = 0
+        self.invalidaciones = 0
+    
+    def _validar_version(self, version):
+        """Vaciar la caché si cambiaron los indicadores"""
+        if version != self._version:
+            if self._entradas:
+                self.invalidaciones += 1
+            self._entradas.clear()
+            self._version = version
+    
+    def obtener(self, clave, version):
+        """Devolver (encontrado, valor) para la clave"""
+        with self._lock:
+            self._validar_version(version)
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                valor, expira = entrada
+                if expira > time.monotonic():
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return True, valor
+                del self._entradas[clave]
+                self.expirados += 1
+            self.fallos += 1
+            return False, None
+    
+    def guardar(self, clave, version, valor):
+        """Guardar un resultado desalojando el menos usado si se excede el tamaño"""
+        with self._lock:
+            self._validar_version(version)
+            self._entradas[clave] = (valor, time.monotonic() + self.ttl_segundos)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+    
+    def limpiar(self):
+        """Vaciar la caché y reiniciar los contadores"""
+        with self._lock:
+            self._entradas.clear()
+            self.aciertos = self.fallos = self.desalojos = 0
+            self.expirados = self.invalidaciones = 0
+    
+    def estadisticas(self):
+        """Contadores de uso de la caché"""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'expirados': self.expirados,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': (self.aciertos / consultas * 100) if consultas else 0.0
+            }
+
+@st.cache_resource
+def obtener_cache_resultados():
+    """Instancia única de la caché para todas las sesiones del proceso"""
+    return CacheResultados()
+
+_VERSION_INDICADORES = [None, None]
+
+def version_indicadores():
+    """Huella determinística de los indicadores vigentes en IND (estable entre reinicios)"""
+    instantanea = tuple(IND.items())
+    if instantanea != _VERSION_INDICADORES[0]:
+        digest = hashlib.sha256(json.dumps(IND, sort_keys=True).encode()).digest()
+        _VERSION_INDICADORES[:] = [instantanea, int.from_bytes(digest[:8], 'big', signed=True)]
+    return _VERSION_INDICADORES[1]
+
+def _huella_tasas(motor):
+    """Huella de las tablas de tasas AFP e ISAPRE de un motor"""
+    return (tuple(sorted(motor.afp_rates.items())), tuple(sorted(motor.isapre_rates.items())))
+
+_HUELLA_TASAS_BASE = []
+
+def _huella_tasas_base():
+    """Huella de las tasas de un MotorFinanciero por defecto (calculada una vez)"""
+    if not _HUELLA_TASAS_BASE:
+        _HUELLA_TASAS_BASE.append(_huella_tasas(MotorFinanciero()))
+    return _HUELLA_TASAS_BASE[0]
+
+def _normalizar_valor(valor):
+    """Normalizar montos para que 500000, 500000.0 y np.int64(500000) compartan clave"""
+    tipo = type(valor)
+    if tipo is int or tipo is float:
+        return round(float(valor), 6)
+    if tipo is str:
+        return valor
+    if isinstance(valor, numbers.Real) and not isinstance(valor, bool):
+        return round(float(valor), 6)
+    return valor
+
+def cachear_resultado(func):
+    """Servir el resultado de func desde la caché compartida (no mutar lo cacheado)"""
+    parametros = inspect.signature(func).parameters
+    nombres = tuple(nombre for nombre in parametros if nombre != 'self')
+    por_defecto = {nombre: p.default for nombre, p in parametros.items() if p.default is not p.empty}
+    es_metodo = 'self' in parametros
+    cache = None
+    
+    @functools.wraps(func)
+    def envoltura(*args, **kwargs):
+        nonlocal cache
+        # Enlace manual de argumentos (inspect.bind domina el costo de un acierto)
+        motor, posicionales = (args[0], args[1:]) if es_metodo else (None, args)
+        argumentos = dict(por_defecto)
+        argumentos.update(zip(nombres, posicionales))
+        argumentos.update(kwargs)
+        huella = _huella_tasas(motor) if motor is not None else _huella_tasas_base()
+        clave = (func.__qualname__, huella) + tuple(_normalizar_valor(argumentos[nombre]) for nombre in nombres)
+        
+        version = version_indicadores()
+        if cache is None:
+            cache = obtener_cache_resultados()
+        encontrado, resultado = cache.obtener(clave, version)
+        if not encontrado:
+            resultado = func(*args, **kwargs)
+            cache.guardar(clave, version, resultado)
+        return resultado
+    
+    return envoltura
+
+# Validación de RUT
+PESOS_RUT = np.array([3, 2, 7, 6, 5, 4, 3, 2])
+DIGITOS_VERIFICADORES = np.array(['', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'K', '0'])
+
+def validar_ruts(ruts):
+    """Normalizar (CUERPO-DV) y validar por módulo 11 una columna de RUT de forma vectorizada"""
+    
+    limpio = (pd.Series(ruts, dtype='object').fillna('').astype(str)
+              .str.upper().str.replace(r'[.\-\s]', '', regex=True))
+    formato = limpio.str.fullmatch(r'\d{1,8}[\dK]').to_numpy(dtype=bool)
+    cuerpo = limpio.str[:-1].where(formato, '0').str.zfill(8)
+    formato = formato & (cuerpo != '00000000').to_numpy()
+    dv = limpio.str[-1].to_numpy(dtype=object)
+    
+    # Dígitos del cuerpo como matriz (n x 8) y módulo 11 ponderado
+    digitos = np.frombuffer(''.join(cuerpo).encode('ascii'), dtype=np.uint8).reshape(-1, 8) - ord('0')
+    resto = 11 - (digitos @ PESOS_RUT) % 11
+    valido = formato & (DIGITOS_VERIFICADORES[resto] == dv)
+    
+    normalizado = cuerpo.str.lstrip('0').str.cat(pd.Series(dv, index=cuerpo.index), sep='-')
+    return pd.DataFrame({
+        'rut': np.where(formato, normalizado, ''),
+        'valido': valido
+    }, index=limpio.index)
+
+_SEPARADORES_RUT = re.compile(r'[.\-\s]')
+_FORMATO_RUT = re.compile(r'\d{1,8}[\dK]')
+
+def validar_rut(rut):
+    """Normalizar y validar un RUT individual; devuelve (rut_normalizado, valido)"""
+    # Mismas reglas que validar_ruts, en Python puro para búsquedas de a uno
+    if not isinstance(rut, str) and pd.isna(rut):
+        return '', False
+    limpio = _SEPARADORES_RUT.sub('', str(rut).upper())
+    cuerpo = limpio[:-1].lstrip('0')
+    if not cuerpo or not _FORMATO_RUT.fullmatch(limpio):
+        return '', False
+    suma = sum(int(digito) * peso for digito, peso in zip(cuerpo.zfill(8), (3, 2, 7, 6, 5, 4, 3, 2)))
+    return f"{cuerpo}-{limpio[-1]}", DIGITOS_VERIFICADORES[11 - suma % 11] == limpio[-1]
+
+class IndiceRUT:
+    """Índice hash de RUT normalizado a filas de un DataFrame de empleados"""
+    
+    def __init__(self, datos, columna='rut'):
+        self.datos = datos.reset_index(drop=True)
+        validacion = validar_ruts(self.datos[columna])
+        self.ruts = validacion['rut'].to_numpy()
+        self.validos = validacion['valido'].to_numpy()
+        # indices entrega posiciones dentro de las filas válidas; se traducen a filas de datos
+        filas_validas = np.flatnonzero(self.validos)
+        grupos = pd.Series(filas_validas).groupby(self.ruts[self.validos]).indices
+        self._posiciones = {rut: filas_validas[posiciones] for rut, posiciones in grupos.items()}
+        self._primera = {rut: int(filas[0]) for rut, filas in self._posiciones.items()}
+    
+    def __len__(self):
+        return len(self._posiciones)
+    
+    def __contains__(self, rut):
+        return validar_rut(rut)[0] in self._posiciones
+    
+    def posiciones(self, rut):
+        """Posiciones de fila para un RUT (vacío si no existe)"""
+        return self._posiciones.get(validar_rut(rut)[0], np.array([], dtype=int))
+    
+    def buscar(self, rut):
+        """Primera fila del RUT, o None si no existe"""
+        posicion = self._primera.get(validar_rut(rut)[0])
+        return None if posicion is None else self.datos.iloc[posicion]
+    
+    def invalidos(self):
+        """Filas con RUT mal formado o con dígito verificador incorrecto"""
+        return self.datos[~self.validos]
+    
+    def duplicados(self):
+        """Filas cuyo RUT aparece más de una vez"""
+        filas = [pos for posiciones in self._posiciones.values() if len(posiciones) > 1 for pos in posiciones]
+        return self.datos.iloc[sorted(filas)]
+    
+    def deduplicar(self):
+        """Primera fila por RUT válido"""
+        return self.datos.iloc[sorted(self._primera.values())]
+    
+    def unir(self, otros, columna='rut', sufijos=('', '_indice')):
+        """Unir filas de otro DataFrame a este índice por RUT (left join sobre otros)"""
+        otros = otros.reset_index(drop=True)
+        posicion = pd.Series(validar_ruts(otros[columna])['rut']).map(self._primera)
+        encontrados = posicion.notna().to_numpy()
+        derecha = self.datos.iloc[posicion[encontrados].astype(int)].reset_index(drop=True)
+        derecha.index = np.flatnonzero(encontrados)
+        return otros.join(derecha, lsuffix=sufijos[0], rsuffix=sufijos[1])
+
+# Bitácora de auditoría
+BITACORA_DIR = os.environ.get('HR_BITACORA_DIR', 'bitacora_calculos')
+
+ESQUEMA_BITACORA = pa.schema([
+    ('timestamp', pa.timestamp('us')),
+    ('tipo', pa.string()),
+    ('rut', pa.string()),
+    ('version_indicadores', pa.int64()),
+    ('indicadores', pa.string()),
+    ('entradas', pa.string()),
+    ('resultados', pa.string())
+])
+
+def _a_json(valor):
+    """Serializar entradas y resultados (incluye escalares NumPy y fechas)"""
+    return json.dumps(valor, ensure_ascii=False, sort_keys=True,
+                      default=lambda o: o.item() if hasattr(o, 'item') else str(o))
+
+class BitacoraCalculos:
+    """Bitácora append-only de cálculos en Parquet, particionada por período (AAAA-MM)"""
+    
+    def __init__(self, directorio=BITACORA_DIR, tamano_lote=5000, intervalo_segundos=60.0,
+                 filas_por_grupo=100000, max_reintentos=3, espera_max_segundos=300.0, max_retenidos=50000):
+        self.directorio = directorio
+        self.tamano_lote = tamano_lote
+        self.intervalo_segundos = intervalo_segundos
+        self.filas_por_grupo = filas_por_grupo
+        self.max_reintentos = max_reintentos
+        self.espera_max_segundos = espera_max_segundos
+        self.max_retenidos = max_retenidos
+        self.compactados = 0
+        self.retenidos = 0
+        self._compactado_el = None
+        self.escritos = 0
+        self.archivos = 0
+        self.descartados = 0
+        self.fallos_consecutivos = 0
+        self.ultimo_error = None
+        self._cola = queue.Queue()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._escritor, name='bitacora-calculos', daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+    
+    def registrar(self, tipo, entradas, resultados, rut=''):
+        """Encolar un cálculo; la serialización ocurre en el hilo escritor"""
+        self._cola.put({
+            'timestamp': datetime.now(),
+            'tipo': tipo,
+            'rut': rut or '',
+            'version_indicadores': version_indicadores(),
+            'indicadores': dict(IND),
+            'entradas': entradas,
+            'resultados': resultados
+        })
+    
+    def pendientes(self):
+        """Cantidad aproximada de registros aún no escritos"""
+        return self._cola.qsize() + self.retenidos
+    
+    def activa(self):
+        """Indicar si el hilo escritor sigue vivo"""
+        return self._hilo.is_alive()
+    
+    def vaciar(self, timeout=30):
+        """Esperar a que se escriban todos los registros encolados"""
+        if not self.activa():
+            return False
+        escrito = threading.Event()
+        self._cola.put(escrito)
+        return escrito.wait(timeout) and self.fallos_consecutivos == 0
+    
+    def cerrar(self):
+        """Detener el hilo escritor tras escribir lo pendiente"""
+        if self._hilo.is_alive():
+            self._detener.set()
+            self._hilo.join()
+    
+    def _escritor(self):
+        """Acumular registros y escribirlos por lotes, con espera creciente tras un error"""
+        lote = []
+        limite = time.monotonic() + self.intervalo_segundos
+        reintentar_en = 0.0
+        while True:
+            try:
+                elemento = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                elemento = None
+            
+            avisos = []
+            if isinstance(elemento, threading.Event):
+                avisos.append(elemento)
+            elif elemento is not None:
+                lote.append(elemento)
+                if len(lote) > self.max_retenidos:
+                    # Falla prolongada: se descartan los registros más antiguos para acotar la memoria
+                    exceso = len(lote) - self.max_retenidos
+                    del lote[:exceso]
+                    self.descartados += exceso
+                    logging.getLogger(__name__).error("Bitácora: %d registro(s) descartados por falla prolongada", exceso)
+            
+            detener = self._detener.is_set() and self._cola.empty()
+            ahora = time.monotonic()
+            if (avisos or detener or len(lote) >= self.tamano_lote or ahora >= limite) and (detener or ahora >= reintentar_en):
+                if lote:
+                    lote = self._escribir_lote(lote)
+                    if detener and lote:
+                        logging.getLogger(__name__).error(
+                            "Bitácora cerrada con %d registro(s) sin escribir", len(lote))
+                reintentar_en = ahora + min(self.intervalo_segundos * 2 ** self.fallos_consecutivos,
+                                            self.espera_max_segundos) if lote else 0.0
+                limite = max(ahora + self.intervalo_segundos, reintentar_en)
+                if not lote:
+                    self._compactar_diario()
+            self.retenidos = len(lote)
+            for aviso in avisos:
+                aviso.set()
+            if detener:
+                return
+    
+    def _escribir_lote(self, lote):
+        """Escribir un lote sin dejar caer el hilo; retorna las filas que quedan pendientes"""
+        try:
+            self._escribir(lote)
+            self.fallos_consecutivos = 0
+            return []
+        except Exception as e:
+            self.fallos_consecutivos += 1
+            self.ultimo_error = f"{type(e).__name__}: {e}"
+            logging.getLogger(__name__).exception(
+                "Error escribiendo la bitácora (intento %d)", self.fallos_consecutivos)
+        if self.fallos_consecutivos % self.max_reintentos:
+            return lote
+        
+        # Cada max_reintentos fallos: fila a fila para aislar registros defectuosos
+        pendientes = []
+        for fila in lote:
+            try:
+                self._escribir([fila])
+            except Exception:
+                pendientes.append(fila)
+        if len(pendientes) == len(lote):
+            # Falla de entorno (disco, permisos): se conserva todo para el próximo intento
+            return lote
+        self.descartados += len(pendientes)
+        self.fallos_consecutivos = 0
+        return []
+    
+    def _compactar_diario(self):
+        """Compactar una vez al día sin dejar caer el hilo ante un error"""
+        hoy = datetime.now().date()
+        if self._compactado_el == hoy:
+            return
+        try:
+            self.compactados += self.compactar()
+            self._compactado_el = hoy
+        except Exception:
+            logging.getLogger(__name__).exception("Error compactando la bitácora")
+    
+    def compactar(self, hoy=None):
+        """Fusionar los archivos de días cerrados (y de períodos cerrados completos) en grupos de filas grandes"""
+        hoy = hoy or datetime.now()
+        if not os.path.isdir(self.directorio):
+            return 0
+        
+        fusionados = 0
+        for carpeta in sorted(os.listdir(self.directorio)):
+            ruta = os.path.join(self.directorio, carpeta)
+            if not carpeta.startswith('periodo=') or not os.path.isdir(ruta):
+                continue
+            archivos = sorted(f for f in os.listdir(ruta) if f.endswith('.parquet'))
+            if carpeta.split('=', 1)[1] < hoy.strftime('%Y-%m'):
+                grupos = {carpeta.split('=', 1)[1]: archivos}
+            else:
+                grupos = {}
+                for archivo in archivos:
+                    dia = archivo[5:13]
+                    if archivo.startswith('part-') and dia < hoy.strftime('%Y%m%d'):
+                        grupos.setdefault(dia, []).append(archivo)
+            
+            for nombre, grupo in grupos.items():
+                if len(grupo) < 2:
+                    continue
+                tabla = pa.concat_tables([pq.read_table(os.path.join(ruta, f), schema=ESQUEMA_BITACORA) for f in grupo])
+                tabla = tabla.sort_by([('rut', 'ascending'), ('timestamp', 'ascending')])
+                destino = f"compacto-{nombre}-{uuid.uuid4().hex[:8]}.parquet"
+                # Prefijo '_' mientras se escribe: el lector de datasets lo ignora
+                pq.write_table(tabla, os.path.join(ruta, f"_{destino}"), row_group_size=self.filas_por_grupo)
+                os.replace(os.path.join(ruta, f"_{destino}"), os.path.join(ruta, destino))
+                for archivo in grupo:
+                    os.remove(os.path.join(ruta, archivo))
+                fusionados += len(grupo)
+        return fusionados
+    
+    def _escribir(self, filas):
+        """Escribir un lote como un archivo Parquet nuevo por período"""
+        por_periodo = {}
+        ruts = validar_ruts([fila['rut'] for fila in filas])
+        for fila, rut, valido in zip(filas, ruts['rut'], ruts['valido']):
+            # Copia serializada: el lote original debe servir para reintentar
+            fila = dict(fila, rut=rut if valido else fila['rut'].strip())
+            for campo in ('indicadores', 'entradas', 'resultados'):
+                fila[campo] = _a_json(fila[campo])
+            por_periodo.setdefault(fila['timestamp'].strftime('%Y-%m'), []).append(fila)
+        
+        for periodo, filas_periodo in por_periodo.items():
+            # Ordenar por RUT para que las estadísticas por grupo de filas sean selectivas
+            filas_periodo.sort(key=lambda f: (f['rut'], f['timestamp']))
+            tabla = pa.Table.from_pylist(filas_periodo, schema=ESQUEMA_BITACORA)
+            carpeta = os.path.join(self.directorio, f"periodo={periodo}")
+            os.makedirs(carpeta, exist_ok=True)
+            nombre = f"part-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}.parquet"
+            pq.write_table(tabla, os.path.join(carpeta, nombre), row_group_size=self.filas_por_grupo)
+            self.escritos += len(filas_periodo)
+            self.archivos += 1
+    
+    def consultar(self, rut=None, desde=None, hasta=None, tipo=None):
+        """Consultar la bitácora por RUT, rango de fechas y tipo de cálculo"""
+        if not os.path.isdir(self.directorio):
+            return ESQUEMA_BITACORA.empty_table().to_pandas()
+        
+        filtro = ds.scalar(True)
+        if rut:
+            rut_normalizado, valido = validar_rut(rut)
+            filtro &= ds.field('rut') == (rut_normalizado if valido else rut.strip())
+        if tipo:
+            filtro &= ds.field('tipo') == tipo
+        if desde is not None:
+            filtro &= ds.field('periodo') >= desde.strftime('%Y-%m')
+            filtro &= ds.field('timestamp') >= pa.scalar(desde, pa.timestamp('us'))
+        if hasta is not None:
+            filtro &= ds.field('periodo') <= hasta.strftime('%Y-%m')
+            filtro &= ds.field('timestamp') <= pa.scalar(hasta, pa.timestamp('us'))
+        
+        for intento in range(2):
+            try:
+                dataset = ds.dataset(self.directorio, format='parquet', partitioning='hive',
+                                     schema=ESQUEMA_BITACORA.append(pa.field('periodo', pa.string())))
+                return dataset.to_table(filter=filtro).to_pandas().sort_values('timestamp', ignore_index=True)
+            except FileNotFoundError:
+                # Una compactación concurrente reemplazó archivos: se relista una vez
+                if intento:
+                    raise
+
+@st.cache_resource
+def obtener_bitacora():
+    """Instancia única de la bitácora para todas las sesiones del proceso"""
+    return BitacoraCalculos()
+
+# Resultados en formato Arrow
+def _tiene_columna(tabla, nombre):
+    """Indicar si un DataFrame o tabla Arrow tiene la columna"""
+    return nombre in (tabla.column_names if isinstance(tabla, pa.Table) else tabla.columns)
+
+def _columna_numpy(tabla, nombre):
+    """Columna como arreglo NumPy (sin copia para columnas numéricas de Arrow)"""
+    if isinstance(tabla, pa.Table):
+        return tabla.column(nombre).to_numpy()
+    return tabla[nombre].to_numpy()
+
+def armar_resultado(columnas, formato='pandas'):
+    """Construir el resultado de un motor por lotes como DataFrame o tabla Arrow"""
+    if formato == 'arrow':
+        return pa.table({
+            nombre: pa.array(pd.Series(valores, dtype='object').astype('string'), type=pa.string(), from_pandas=True)
+            if getattr(valores, 'dtype', None) == object else valores
+            for nombre, valores in columnas.items()
+        })
+    if formato == 'pandas':
+        return pd.DataFrame(columnas)
+    raise ValueError(f"Formato de resultado desconocido: {formato}")
+
+def a_pandas(tabla):
+    """Convertir a DataFrame solo si el resultado viene en Arrow"""
+    return tabla.to_pandas() if isinstance(tabla, pa.Table) else tabla
+
+def escribir_parquet(tabla, ruta):
+    """Escribir un resultado (Arrow o DataFrame) a Parquet en una ruta o flujo"""
+    if not isinstance(tabla, pa.Table):
+        tabla = pa.Table.from_pandas(tabla, preserve_index=False)
+    pq.write_table(tabla, ruta)
+
+def leer_parquet(ruta, columnas=None):
+    """Leer un resultado Parquet como tabla Arrow con memoria mapeada"""
+    return pq.read_table(ruta, columns=columnas, memory_map=True)
+
+def tabla_a_bytes(tabla, formato='parquet'):
+    """Serializar una tabla Arrow para descarga (Parquet o CSV) sin pasar por filas"""
+    destino = pa.BufferOutputStream()
+    if formato == 'parquet':
+        escribir_parquet(tabla, destino)
+    elif formato == 'csv':
+        if not isinstance(tabla, pa.Table):
+            tabla = pa.Table.from_pandas(tabla, preserve_index=False)
+        pacsv.write_csv(tabla, destino)
+    else:
+        raise ValueError(f"Formato de descarga desconocido: {formato}")
+    return destino.getvalue().to_pybytes()
 
 class MotorFinanciero:
     """Motor financiero para cálculos de liquidaciones"""
@@ -146,7 +765,13 @@ class MotorFinanciero:
             'cruz_blanca': 7.0,
             'mas_vida': 7.0
         }
+        self.tasas_empleador = {
+            'afc': 2.4,
+            'sis': 1.49,
+            'mutual': 0.93
+        }
     
+    @cachear_resultado
     def calcular_liquidacion(self, sueldo_bruto, afp='capital', isapre='banmedica', 
                           gratificacion=0, horas_extra=0, otros_haberes=0):
         """Calcular liquidación completa"""
@@ -176,6 +801,73 @@ class MotorFinanciero:
             'porcentaje_salud': self.isapre_rates[isapre]
         }
     
+    def _preparar_nomina(self, nomina):
+        """Extraer las columnas de una nómina (DataFrame o tabla Arrow) como arreglos NumPy"""
+        
+        n = len(nomina)
+        
+        def columna(nombre, defecto):
+            if _tiene_columna(nomina, nombre):
+                return _columna_numpy(nomina, nombre)
+            return np.full(n, defecto)
+        
+        def tasas(nombres, tabla, etiqueta):
+            # Buscar cada institución distinta una sola vez y expandir por código
+            codigos, instituciones = pd.factorize(nombres)
+            desconocidas = [i for i in instituciones if i not in tabla]
+            if desconocidas or (codigos < 0).any():
+                raise ValueError(f"{etiqueta} desconocida: {sorted(map(str, desconocidas)) or ['(vacía)']}")
+            return np.array([tabla[i] for i in instituciones], dtype=float)[codigos]
+        
+        porcentaje_afp = tasas(columna('afp', 'capital'), self.afp_rates, 'AFP')
+        porcentaje_salud = tasas(columna('isapre', 'banmedica'), self.isapre_rates, 'ISAPRE')
+        
+        return {
+            'sueldo_bruto': columna('sueldo_bruto', 0).astype(float),
+            'gratificacion': columna('gratificacion', 0).astype(float),
+            'horas_extra': columna('horas_extra', 0).astype(float),
+            'otros_haberes': columna('otros_haberes', 0).astype(float),
+            'porcentaje_afp': porcentaje_afp,
+            'porcentaje_salud': porcentaje_salud
+        }
+    
+    def calcular_liquidacion_lote(self, nomina, regimen_gratificacion=None, formato='pandas'):
+        """Calcular liquidaciones de toda una nómina de forma vectorizada"""
+        
+        datos = self._preparar_nomina(nomina)
+        if regimen_gratificacion == 'art50':
+            datos['gratificacion'] = gratificacion_art50(
+                datos['sueldo_bruto'] + datos['horas_extra'] + datos['otros_haberes'])
+        elif regimen_gratificacion is not None:
+            raise ValueError(f"Régimen de gratificación no soportado en lote: {regimen_gratificacion}")
+        
+        # Base imponible
+        base_imponible = (datos['sueldo_bruto'] + datos['gratificacion'] +
+                          datos['horas_extra'] + datos['otros_haberes'])
+        
+        # Descuentos legales
+        descuento_afp = (datos['porcentaje_afp'] / 100) * base_imponible
+        descuento_salud = (datos['porcentaje_salud'] / 100) * base_imponible
+        descuento_afc = 0.006 * base_imponible
+        
+        columnas = {
+            'bruto': datos['sueldo_bruto'],
+            'gratificacion': datos['gratificacion'],
+            'horas_extra': datos['horas_extra'],
+            'otros_haberes': datos['otros_haberes'],
+            'base_imponible': base_imponible,
+            'descuento_afp': descuento_afp,
+            'descuento_salud': descuento_salud,
+            'descuento_afc': descuento_afc,
+            'liquido': base_imponible - descuento_afp - descuento_salud - descuento_afc,
+            'porcentaje_afp': datos['porcentaje_afp'],
+            'porcentaje_salud': datos['porcentaje_salud']
+        }
+        if _tiene_columna(nomina, 'rut'):
+            columnas = {'rut': _columna_numpy(nomina, 'rut'), **columnas}
+        return armar_resultado(columnas, formato)
+    
+    @cachear_resultado
     def calcular_sueldo_objetivo(self, sueldo_liquido_objetivo, afp='capital', isapre='banmedica'):
         """Calcular sueldo bruto necesario para obtener sueldo líquido deseado"""
         
@@ -192,6 +884,531 @@ class MotorFinanciero:
             'verificacion': verificacion
         }
 
+# Gratificación legal
+TASA_GRATIFICACION = 0.25
+TASA_UTILIDAD_ART47 = 0.30
+
+def gratificacion_art50(remuneracion, imm=None):
+    """Gratificación mensual Art. 50: 25% de la remuneración con tope de 4,75 IMM anuales prorrateado"""
+    imm = IND['imm'] if imm is None else imm
+    return np.minimum(TASA_GRATIFICACION * np.asarray(remuneracion, dtype=float),
+                      IND['tope_gratificacion'] * np.asarray(imm, dtype=float) / 12)
+
+def calcular_gratificacion_anual(remuneraciones, regimen='art50', imm=None, utilidad_liquida=None):
+    """Calcular la gratificación de la dotación sobre una matriz empleados x meses"""
+    
+    remuneraciones = np.asarray(remuneraciones, dtype=float)
+    
+    if regimen == 'art50':
+        mensual = gratificacion_art50(remuneraciones, imm)
+    elif regimen == 'art47':
+        if utilidad_liquida is None:
+            raise ValueError("El régimen Art. 47 requiere la utilidad líquida del ejercicio")
+        total = remuneraciones.sum()
+        mensual = TASA_UTILIDAD_ART47 * utilidad_liquida * remuneraciones / total if total else np.zeros_like(remuneraciones)
+    else:
+        raise ValueError(f"Régimen de gratificación desconocido: {regimen}")
+    
+    return {
+        'mensual': mensual,
+        'anual': mensual.sum(axis=1),
+        'total': float(mensual.sum()),
+        'regimen': regimen
+    }
+
+# Simulación de escenarios de costo
+def generar_escenarios(n_escenarios=1, meses=12, inflacion_uf_mensual=0.3, volatilidad_uf=0.0,
+                       reajuste_imm=5.0, mes_reajuste_imm=4, volatilidad_imm=0.0,
+                       reajuste_sueldos=4.0, mes_reajuste_sueldos=0, volatilidad_sueldos=0.0,
+                       semilla=None):
+    """Generar trayectorias (n_escenarios x meses) de UF, IMM y reajuste de sueldos"""
+    
+    rng = np.random.default_rng(semilla)
+    
+    # UF: inflación mensual con ruido normal
+    variacion_uf = rng.normal(inflacion_uf_mensual, volatilidad_uf, (n_escenarios, meses)) / 100
+    uf = IND['uf'] * np.cumprod(1 + variacion_uf, axis=1)
+    
+    # IMM y sueldos: un reajuste escalonado en el mes indicado
+    meses_idx = np.arange(meses)
+    alza_imm = rng.normal(reajuste_imm, volatilidad_imm, (n_escenarios, 1)) / 100
+    imm = IND['imm'] * (1 + alza_imm * (meses_idx >= mes_reajuste_imm))
+    alza_sueldos = rng.normal(reajuste_sueldos, volatilidad_sueldos, (n_escenarios, 1)) / 100
+    ajuste = 1 + alza_sueldos * (meses_idx >= mes_reajuste_sueldos)
+    
+    return {'uf': uf, 'imm': imm, 'ajuste': ajuste}
+
+def simular_costo_planilla(dotacion, escenarios, percentiles=(5, 50, 95), memoria_max_mb=64, motor=None,
+                           regimen_gratificacion=None):
+    """Simular el costo mensual de la planilla bajo trayectorias de indicadores"""
+    
+    motor = motor or MotorFinanciero()
+    datos = motor._preparar_nomina(dotacion)
+    
+    uf = np.atleast_2d(np.asarray(escenarios['uf'], dtype=float))
+    imm = np.atleast_2d(np.asarray(escenarios['imm'], dtype=float))
+    ajuste = np.atleast_2d(np.asarray(escenarios['ajuste'], dtype=float))
+    n_escenarios = max(uf.shape[0], imm.shape[0], ajuste.shape[0])
+    meses = max(uf.shape[1], imm.shape[1], ajuste.shape[1])
+    uf, imm, ajuste = (np.broadcast_to(x, (n_escenarios, meses)) for x in (uf, imm, ajuste))
+    
+    sueldo_base = datos['sueldo_bruto']
+    variables = datos['horas_extra'] + datos['otros_haberes']
+    tasa_trabajador = (datos['porcentaje_afp'] + datos['porcentaje_salud'] + 0.6) / 100
+    tasa_empleador = sum(motor.tasas_empleador.values()) / 100
+    tope = IND['tope_imponible_uf'] * uf
+    
+    # Gratificación: Art. 50 la recalcula con el IMM de cada escenario; si no, se usa la columna fija
+    if regimen_gratificacion == 'art50':
+        tope_gratificacion = IND['tope_gratificacion'] * imm / 12
+        factor = 1 + TASA_GRATIFICACION
+        quiebre = tope_gratificacion / (TASA_GRATIFICACION * ajuste)
+        limite_tope = np.where(factor * tope_gratificacion / TASA_GRATIFICACION >= tope,
+                               tope / (factor * ajuste), (tope - tope_gratificacion) / ajuste)
+    elif regimen_gratificacion is None:
+        variables = variables + datos['gratificacion']
+        tope_gratificacion = np.zeros((n_escenarios, meses))
+        factor = 1.0
+        quiebre = np.full((n_escenarios, meses), np.inf)
+        limite_tope = tope / ajuste
+    else:
+        raise ValueError(f"Régimen de gratificación no soportado en escenarios: {regimen_gratificacion}")
+    
+    totales = {nombre: np.zeros((n_escenarios, meses))
+               for nombre in ('haberes', 'base_cotizable', 'descuentos_trabajador')}
+    
+    # Empleados que nunca caen bajo el IMM: sus haberes son lineales por tramos en
+    # (base + variables), así que gratificación y tope se resuelven con sumas acumuladas
+    sobre_piso = sueldo_base >= (imm / ajuste).max()
+    total_ordenado = sueldo_base[sobre_piso] + variables[sobre_piso]
+    orden = np.argsort(total_ordenado)
+    total_ordenado = total_ordenado[orden]
+    tasa_ordenada = tasa_trabajador[sobre_piso][orden]
+    acum_total = np.concatenate(([0.0], np.cumsum(total_ordenado)))
+    acum_tasa = np.concatenate(([0.0], np.cumsum(tasa_ordenada)))
+    acum_total_tasa = np.concatenate(([0.0], np.cumsum(total_ordenado * tasa_ordenada)))
+    n_ordenados = len(total_ordenado)
+    
+    # Tramos: [0, con_factor) gratificación proporcional, [con_factor, bajo_tope) gratificación
+    # topada y [bajo_tope, n) base cotizable topada
+    sin_tope_grat = np.searchsorted(total_ordenado, quiebre, side='right')
+    bajo_tope = np.searchsorted(total_ordenado, limite_tope, side='right')
+    con_factor = np.minimum(sin_tope_grat, bajo_tope)
+    
+    totales['haberes'] += (factor * ajuste * acum_total[sin_tope_grat] +
+                           ajuste * (acum_total[-1] - acum_total[sin_tope_grat]) +
+                           tope_gratificacion * (n_ordenados - sin_tope_grat))
+    totales['base_cotizable'] += (factor * ajuste * acum_total[con_factor] +
+                                  ajuste * (acum_total[bajo_tope] - acum_total[con_factor]) +
+                                  tope_gratificacion * (bajo_tope - con_factor) +
+                                  tope * (n_ordenados - bajo_tope))
+    totales['descuentos_trabajador'] += (factor * ajuste * acum_total_tasa[con_factor] +
+                                         ajuste * (acum_total_tasa[bajo_tope] - acum_total_tasa[con_factor]) +
+                                         tope_gratificacion * (acum_tasa[bajo_tope] - acum_tasa[con_factor]) +
+                                         tope * (acum_tasa[-1] - acum_tasa[bajo_tope]))
+    
+    # Empleados que pueden quedar en el piso IMM: cálculo denso por bloques
+    sueldo_base = sueldo_base[~sobre_piso]
+    variables = variables[~sobre_piso]
+    tasa_trabajador = tasa_trabajador[~sobre_piso]
+    n_densos = len(sueldo_base)
+    
+    # Tamaño de bloque según el presupuesto de memoria (~6 temporales float64)
+    elementos_max = max(1, int(memoria_max_mb * 2**20 / (8 * 6)))
+    bloque_empleados = max(1, min(n_densos, elementos_max // meses))
+    bloque_escenarios = max(1, elementos_max // (bloque_empleados * meses))
+    
+    for s0 in range(0, n_escenarios, bloque_escenarios):
+        s1 = min(s0 + bloque_escenarios, n_escenarios)
+        aj = ajuste[s0:s1, None, :]
+        tope_bloque = tope[s0:s1, None, :]
+        piso = imm[s0:s1, None, :]
+        tope_grat_bloque = tope_gratificacion[s0:s1, None, :]
+        
+        for e0 in range(0, n_densos, bloque_empleados):
+            e1 = min(e0 + bloque_empleados, n_densos)
+            
+            # Haberes del bloque (escenario x empleado x mes)
+            haberes = np.maximum(sueldo_base[None, e0:e1, None] * aj, piso)
+            haberes += variables[None, e0:e1, None] * aj
+            if regimen_gratificacion == 'art50':
+                haberes += np.minimum(TASA_GRATIFICACION * haberes, tope_grat_bloque)
+            base_cotizable = np.minimum(haberes, tope_bloque)
+            
+            totales['haberes'][s0:s1] += haberes.sum(axis=1)
+            totales['base_cotizable'][s0:s1] += base_cotizable.sum(axis=1)
+            totales['descuentos_trabajador'][s0:s1] += np.einsum(
+                'sem,e->sm', base_cotizable, tasa_trabajador[e0:e1])
+    
+    totales['aportes_empleador'] = totales.pop('base_cotizable') * tasa_empleador
+    totales['costo_empleador'] = totales['haberes'] + totales['aportes_empleador']
+    totales['liquido'] = totales['haberes'] - totales['descuentos_trabajador']
+    
+    # Bandas de percentiles por mes
+    filas = []
+    for metrica in ('costo_empleador', 'haberes', 'aportes_empleador', 'descuentos_trabajador', 'liquido'):
+        valores = totales[metrica]
+        bandas = np.percentile(valores, percentiles, axis=0)
+        tabla = pd.DataFrame({'mes': np.arange(1, meses + 1), 'metrica': metrica,
+                              'media': valores.mean(axis=0)})
+        for p, banda in zip(percentiles, bandas):
+            tabla[f'p{p}'] = banda
+        filas.append(tabla)
+    
+    return {
+        'totales': totales,
+        'bandas': pd.concat(filas, ignore_index=True),
+        'n_escenarios': n_escenarios,
+        'n_empleados': len(dotacion),
+        'meses': meses
+    }
+
+# Conciliación entre períodos
+COMPONENTES_CONCILIACION = ['delta_base', 'delta_gratificacion', 'delta_horas_extra',
+                            'delta_otros_haberes', 'delta_tasas', 'delta_indicadores', 'delta_movimiento']
+
+def conciliar_liquidaciones(anterior, actual):
+    """Explicar por componente la variación del líquido por trabajador entre dos períodos"""
+    
+    montos = ['bruto', 'gratificacion', 'horas_extra', 'otros_haberes', 'base_imponible', 'liquido']
+    columnas = montos + ['porcentaje_afp', 'porcentaje_salud']
+    observaciones = []
+    
+    def preparar(corrida, periodo):
+        indice = IndiceRUT(a_pandas(corrida)[['rut'] + columnas])
+        observaciones.append(indice.invalidos().assign(periodo=periodo, motivo='RUT inválido'))
+        observaciones.append(indice.duplicados().assign(periodo=periodo, motivo='RUT repetido (sumado)'))
+        
+        validas = indice.datos[indice.validos].assign(rut=indice.ruts[indice.validos])
+        # Montos sumados por RUT; las tasas se toman de la primera línea
+        agregacion = dict.fromkeys(montos, 'sum') | dict.fromkeys(['porcentaje_afp', 'porcentaje_salud'], 'first')
+        return validas.groupby('rut', sort=False).agg(agregacion).reset_index()
+    
+    unidas = pd.merge(preparar(anterior, 'anterior'), preparar(actual, 'actual'), on='rut', how='outer',
+                      suffixes=('_anterior', '_actual'), indicator=True, validate='one_to_one')
+    
+    estado = unidas.pop('_merge').map({'both': 'Continúa', 'left_only': 'Baja', 'right_only': 'Alta'})
+    continua = (estado == 'Continúa').to_numpy()
+    valores = {col: unidas[col].fillna(0).to_numpy(dtype=float)
+               for col in unidas.columns if col != 'rut'}
+    
+    tasa_anterior = (valores['porcentaje_afp_anterior'] + valores['porcentaje_salud_anterior'] + 0.6) / 100
+    tasa_actual = (valores['porcentaje_afp_actual'] + valores['porcentaje_salud_actual'] + 0.6) / 100
+    delta_liquido = valores['liquido_actual'] - valores['liquido_anterior']
+    
+    detalle = pd.DataFrame({
+        'rut': unidas['rut'],
+        'estado': estado.to_numpy(),
+        'liquido_anterior': valores['liquido_anterior'],
+        'liquido_actual': valores['liquido_actual'],
+        'delta_liquido': delta_liquido
+    })
+    
+    # Atribución por componente (solo trabajadores presentes en ambos períodos)
+    for componente in ('bruto', 'gratificacion', 'horas_extra', 'otros_haberes'):
+        nombre = 'delta_base' if componente == 'bruto' else f'delta_{componente}'
+        delta = valores[f'{componente}_actual'] - valores[f'{componente}_anterior']
+        detalle[nombre] = np.where(continua, (1 - tasa_anterior) * delta, 0.0)
+    detalle['delta_tasas'] = np.where(continua, -(tasa_actual - tasa_anterior) * valores['base_imponible_actual'], 0.0)
+    explicado = detalle[COMPONENTES_CONCILIACION[:5]].sum(axis=1).to_numpy()
+    detalle['delta_indicadores'] = np.where(continua, delta_liquido - explicado, 0.0)
+    detalle['delta_movimiento'] = np.where(continua, 0.0, delta_liquido)
+    
+    resumen = pd.DataFrame({
+        'componente': ['delta_liquido'] + COMPONENTES_CONCILIACION,
+        'monto': [detalle['delta_liquido'].sum()] + [detalle[c].sum() for c in COMPONENTES_CONCILIACION]
+    })
+    
+    observaciones = pd.concat(observaciones, ignore_index=True)
+    return {
+        'detalle': detalle,
+        'resumen': resumen,
+        'conteo': estado.value_counts().to_dict(),
+        'observaciones': observaciones[['periodo', 'motivo', 'rut'] + columnas]
+    }
+
+def iterar_csv(tabla, filas_por_bloque=50000):
+    """Serializar un DataFrame a CSV por bloques para escribirlo de forma incremental"""
+    
+    for inicio in range(0, max(len(tabla), 1), filas_por_bloque):
+        bloque = tabla.iloc[inicio:inicio + filas_por_bloque]
+        yield bloque.to_csv(index=False, header=(inicio == 0)).encode('utf-8')
+
+def escribir_csv_temporal(tabla, anterior=None):
+    """Escribir un DataFrame por bloques a un CSV temporal (eliminando el anterior) y retornar su ruta"""
+    if anterior and os.path.exists(anterior):
+        os.remove(anterior)
+    with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as archivo:
+        for bloque in iterar_csv(tabla):
+            archivo.write(bloque)
+    return archivo.name
+
+# Asistencia y horas extra
+RECARGO_HORAS_EXTRA = 0.5
+
+def _clave_rut(ruts):
+    """Clave de cruce por RUT: normalizado si es válido, el valor original si no ('' si falta)"""
+    ruts = pd.Series(ruts, dtype='object')
+    validacion = validar_ruts(ruts)
+    originales = ruts.fillna('').astype(str).str.strip().to_numpy()
+    return pd.Series(np.where(validacion['valido'].to_numpy(), validacion['rut'].to_numpy(), originales),
+                     index=ruts.index, dtype='object')
+
+# Valores aceptados en la columna tipo (True = entrada)
+TIPOS_MARCACION = {
+    'entrada': True, 'e': True, 'in': True, 'ingreso': True,
+    'salida': False, 's': False, 'out': False, 'egreso': False
+}
+
+def _formato_fecha_marcaciones(fechas):
+    """Inferir un único formato de fecha (día primero salvo ISO) desde las primeras marcaciones"""
+    for valor in fechas.dropna().astype(str).str.strip().head(100):
+        formato = guess_datetime_format(valor, dayfirst=not valor[:4].isdigit())
+        if formato:
+            return formato
+    raise ValueError("No se reconoce el formato de fecha_hora; indica formato_fecha")
+
+def _bloques_marcaciones(fuente, filas_por_bloque):
+    """Iterar bloques de marcaciones desde una ruta/archivo CSV o un iterable de DataFrames"""
+    if isinstance(fuente, pd.DataFrame):
+        yield fuente
+    elif isinstance(fuente, (str, os.PathLike)) or hasattr(fuente, 'read'):
+        yield from pd.read_csv(fuente, chunksize=filas_por_bloque, usecols=['rut', 'fecha_hora', 'tipo'],
+                               dtype={'rut': str, 'tipo': str})
+    else:
+        yield from fuente
+
+def agregar_marcaciones(fuente, filas_por_bloque=500000, max_horas_turno=24, formato_fecha=None):
+    """Emparejar marcaciones de entrada/salida por bloques y sumar horas por trabajador y semana"""
+    
+    acumulado = None
+    abiertas = None
+    ruts_normalizados = {}
+    anomalias = dict.fromkeys(['sin_rut', 'tipo_desconocido', 'fecha_invalida', 'sin_pareja', 'duracion_invalida'], 0)
+    
+    for bloque in _bloques_marcaciones(fuente, filas_por_bloque):
+        bloque = bloque[['rut', 'fecha_hora', 'tipo']].copy()
+        
+        # Tipo: solo valores conocidos; un bloque sin ninguno indica un archivo mal interpretado
+        entrada = bloque['tipo'].astype('string').str.strip().str.lower().map(TIPOS_MARCACION)
+        if len(bloque) and entrada.isna().all():
+            desconocidos = ', '.join(map(str, bloque['tipo'].drop_duplicates().head(5)))
+            raise ValueError(f"Ningún tipo de marcación reconocido (valores: {desconocidos}); "
+                             f"se aceptan {', '.join(TIPOS_MARCACION)}")
+        
+        # Fecha: un único formato explícito para todo el flujo, independiente del tamaño de bloque
+        if pd.api.types.is_datetime64_any_dtype(bloque['fecha_hora']):
+            fecha = bloque['fecha_hora']
+        else:
+            formato_fecha = formato_fecha or _formato_fecha_marcaciones(bloque['fecha_hora'])
+            fecha = pd.to_datetime(bloque['fecha_hora'].astype('string').str.strip(), format=formato_fecha,
+                                   errors='coerce')
+        
+        sin_rut = bloque['rut'].isna().to_numpy() | (bloque['rut'].astype(str).str.strip() == '').to_numpy()
+        tipo_desconocido = ~sin_rut & entrada.isna().to_numpy()
+        fecha_invalida = ~sin_rut & ~tipo_desconocido & fecha.isna().to_numpy()
+        anomalias['sin_rut'] += int(sin_rut.sum())
+        anomalias['tipo_desconocido'] += int(tipo_desconocido.sum())
+        anomalias['fecha_invalida'] += int(fecha_invalida.sum())
+        validas = ~(sin_rut | tipo_desconocido | fecha_invalida)
+        bloque = bloque[validas]
+        if bloque.empty:
+            continue
+        
+        # Normalizar solo los RUT distintos del bloque
+        codigos, distintos = pd.factorize(bloque['rut'].astype(str))
+        nuevos = [r for r in distintos if r not in ruts_normalizados]
+        if nuevos:
+            ruts_normalizados.update(zip(nuevos, _clave_rut(nuevos)))
+        bloque['rut'] = np.array([ruts_normalizados[r] for r in distintos], dtype=object)[codigos]
+        bloque['fecha_hora'] = fecha[validas].to_numpy()
+        bloque['entrada'] = entrada[validas].to_numpy(dtype=bool)
+        
+        if abiertas is not None:
+            bloque = pd.concat([abiertas, bloque[abiertas.columns]], ignore_index=True)
+        bloque = bloque.sort_values(['rut', 'fecha_hora'], kind='stable', ignore_index=True)
+        
+        rut = bloque['rut'].to_numpy()
+        entrada = bloque['entrada'].to_numpy()
+        mismo_siguiente = np.append(rut[1:] == rut[:-1], False)
+        
+        # Entrada seguida de salida del mismo trabajador
+        par = entrada & mismo_siguiente & ~np.append(entrada[1:], True)
+        ultima_del_rut = ~mismo_siguiente
+        abiertas_mask = entrada & ultima_del_rut
+        salida_emparejada = np.insert(par[:-1], 0, False)
+        anomalias['sin_pareja'] += int((entrada & ~par & ~abiertas_mask).sum() + (~entrada & ~salida_emparejada).sum())
+        abiertas = bloque.loc[abiertas_mask, ['rut', 'fecha_hora', 'entrada']]
+        
+        inicio = bloque['fecha_hora'].to_numpy()[par]
+        fin = bloque['fecha_hora'].to_numpy()[salida_emparejada]
+        horas = (fin - inicio) / np.timedelta64(1, 'h')
+        validos = (horas > 0) & (horas <= max_horas_turno)
+        anomalias['duracion_invalida'] += int((~validos).sum())
+        
+        inicio = pd.DatetimeIndex(inicio[validos])
+        turnos = pd.DataFrame({
+            'rut': rut[par][validos],
+            'semana': inicio.normalize() - pd.to_timedelta(inicio.weekday, unit='D'),
+            'horas': horas[validos]
+        })
+        parcial = turnos.groupby(['rut', 'semana'])['horas'].agg(['sum', 'size'])
+        acumulado = parcial if acumulado is None else acumulado.add(parcial, fill_value=0)
+    
+    anomalias['sin_pareja'] += 0 if abiertas is None else len(abiertas)
+    if acumulado is None:
+        acumulado = pd.DataFrame({'sum': [], 'size': []},
+                                 index=pd.MultiIndex.from_arrays([[], []], names=['rut', 'semana']))
+    semanas = acumulado.rename(columns={'sum': 'horas', 'size': 'turnos'}).reset_index()
+    semanas['turnos'] = semanas['turnos'].astype(int)
+    return semanas, anomalias
+
+def calcular_horas_extra(semanas, nomina, recargo=RECARGO_HORAS_EXTRA):
+    """Convertir horas semanales en horas ordinarias, extra y su monto en pesos"""
+    
+    contratos = nomina[['rut', 'sueldo_bruto']].copy()
+    if 'jornada_semanal' in nomina:
+        contratos['jornada_semanal'] = nomina['jornada_semanal'].fillna(IND['jornada_semanal']).to_numpy()
+    else:
+        contratos['jornada_semanal'] = IND['jornada_semanal']
+    contratos['rut'] = _clave_rut(contratos['rut']).to_numpy()
+    # Una fila de contrato por clave: el cruce con las semanas debe ser muchos a uno
+    contratos = contratos[contratos['rut'] != ''].drop_duplicates('rut')
+    
+    semanas = semanas.merge(contratos[['rut', 'jornada_semanal']], on='rut', how='inner', validate='many_to_one')
+    semanas['horas_ordinarias'] = np.minimum(semanas['horas'], semanas['jornada_semanal'])
+    semanas['horas_extra'] = semanas['horas'] - semanas['horas_ordinarias']
+    
+    horas = semanas.groupby('rut')[['horas', 'horas_ordinarias', 'horas_extra']].sum().reset_index()
+    horas = horas.rename(columns={'horas': 'horas_trabajadas'}).merge(contratos, on='rut', how='left')
+    horas['valor_hora'] = horas['sueldo_bruto'] / 30 * 28 / (4 * horas['jornada_semanal'])
+    horas['monto_horas_extra'] = (horas['horas_extra'] * horas['valor_hora'] * (1 + recargo)).round()
+    return horas
+
+def aplicar_horas_extra(nomina, horas):
+    """Completar la columna horas_extra ($) de la nómina para calcular_liquidacion_lote"""
+    
+    montos = horas.set_index('rut')['monto_horas_extra']
+    nomina = nomina.copy()
+    nomina['horas_extra'] = _clave_rut(nomina['rut']).map(montos).fillna(0).to_numpy()
+    return nomina
+
+# Procesamiento multiempresa
+class TablasCompartidas:
+    """IND y tablas de tasas publicadas una sola vez en memoria compartida"""
+    
+    def __init__(self, motor=None):
+        motor = motor or MotorFinanciero()
+        tablas = {
+            'ind': IND,
+            'afp': motor.afp_rates,
+            'isapre': motor.isapre_rates,
+            'empleador': motor.tasas_empleador
+        }
+        self.claves = {nombre: list(tabla) for nombre, tabla in tablas.items()}
+        valores = np.array([float(tabla[clave]) for nombre, tabla in tablas.items()
+                            for clave in self.claves[nombre]])
+        self._shm = shared_memory.SharedMemory(create=True, size=max(valores.nbytes, 1))
+        np.ndarray(valores.shape, dtype=np.float64, buffer=self._shm.buf)[:] = valores
+    
+    def descriptor(self):
+        """Datos mínimos para que un proceso se conecte al segmento"""
+        return self._shm.name, self.claves
+    
+    @staticmethod
+    def leer(nombre, claves):
+        """Conectarse a un segmento existente y reconstruir las tablas"""
+        shm = shared_memory.SharedMemory(name=nombre)
+        total = sum(len(lista) for lista in claves.values())
+        valores = np.ndarray((total,), dtype=np.float64, buffer=shm.buf)
+        tablas, inicio = {}, 0
+        for tabla, lista in claves.items():
+            tablas[tabla] = dict(zip(lista, valores[inicio:inicio + len(lista)].tolist()))
+            inicio += len(lista)
+        return shm, tablas
+    
+    def liberar(self):
+        """Cerrar y eliminar el segmento"""
+        self._shm.close()
+        self._shm.unlink()
+
+_MOTOR_TRABAJADOR = None
+
+def _iniciar_trabajador(nombre, claves):
+    """Inicializador de cada proceso: motor construido desde la memoria compartida"""
+    global _MOTOR_TRABAJADOR
+    shm, tablas = TablasCompartidas.leer(nombre, claves)
+    IND.update(tablas['ind'])
+    _MOTOR_TRABAJADOR = MotorFinanciero()
+    _MOTOR_TRABAJADOR.afp_rates = tablas['afp']
+    _MOTOR_TRABAJADOR.isapre_rates = tablas['isapre']
+    _MOTOR_TRABAJADOR.tasas_empleador = tablas['empleador']
+    shm.close()
+
+def leer_nomina(ruta):
+    """Leer una nómina desde CSV, Excel o Parquet (este último como tabla Arrow)"""
+    if ruta.endswith('.parquet'):
+        return leer_parquet(ruta)
+    if ruta.endswith('.csv'):
+        return pd.read_csv(ruta, dtype={'rut': str})
+    return pd.read_excel(ruta, dtype={'rut': str})
+
+def _procesar_empresa(empresa, ruta):
+    """Liquidar la nómina de una empresa dentro de un proceso de trabajo"""
+    inicio = time.perf_counter()
+    nomina = leer_nomina(ruta)
+    lectura = time.perf_counter()
+    resultado = _MOTOR_TRABAJADOR.calcular_liquidacion_lote(nomina, formato='arrow')
+    resultado = resultado.add_column(0, 'empresa', pa.array([empresa]).take(np.zeros(len(resultado), dtype=np.int32)))
+    fin = time.perf_counter()
+    return resultado, {
+        'empresa': empresa,
+        'trabajadores': resultado.num_rows,
+        'segundos_lectura': lectura - inicio,
+        'segundos_calculo': fin - lectura,
+        'pid': os.getpid()
+    }
+
+def separar_por_empresa(nomina, directorio, columna='empresa'):
+    """Escribir una nómina consolidada como un archivo Parquet por empresa"""
+    archivos = {}
+    for empresa, grupo in nomina.groupby(columna, sort=False):
+        ruta = os.path.join(directorio, f"{uuid.uuid4().hex}.parquet")
+        grupo.drop(columns=columna).to_parquet(ruta, index=False)
+        archivos[str(empresa)] = ruta
+    return archivos
+
+def procesar_empresas(archivos, max_procesos=None, motor=None, formato='pandas'):
+    """Liquidar varias empresas en paralelo, una empresa por tarea"""
+    
+    inicio = time.perf_counter()
+    tablas = TablasCompartidas(motor)
+    # Sin fork: los hilos del servidor y de la bitácora pueden retener locks al bifurcar
+    metodos = multiprocessing.get_all_start_methods()
+    contexto = multiprocessing.get_context('forkserver' if 'forkserver' in metodos else 'spawn')
+    orden = sorted(archivos, key=lambda empresa: os.path.getsize(archivos[empresa]), reverse=True)
+    
+    resultados, tiempos = {}, []
+    try:
+        with ProcessPoolExecutor(max_workers=max_procesos, mp_context=contexto,
+                                 initializer=_iniciar_trabajador, initargs=tablas.descriptor()) as pool:
+            futuros = [pool.submit(_procesar_empresa, empresa, archivos[empresa]) for empresa in orden]
+            for futuro in as_completed(futuros):
+                resultado, tiempo = futuro.result()
+                resultados[tiempo['empresa']] = resultado
+                tiempos.append(tiempo)
+    finally:
+        tablas.liberar()
+    
+    # Las nóminas pueden traer columnas distintas (p. ej. sin rut): se unifican los esquemas
+    consolidado = (pa.concat_tables([resultados[e] for e in archivos], promote_options='default')
+                   if resultados else pa.table({}))
+    return {
+        'resultados': consolidado if formato == 'arrow' else consolidado.to_pandas(),
+        'tiempos': pd.DataFrame(tiempos).sort_values('empresa', ignore_index=True),
+        'segundos_total': time.perf_counter() - inicio
+    }
+
 def generar_contrato_trabajo(datos):
     """Generar contrato de trabajo en PDF"""
     
@@ -234,8 +1451,13 @@ Firma Empleador: _________________    Firma Trabajador: _________________
         except:
             pdf.cell(0, 8, linea, 0, 1)
     
-    return pdf.output(dest='S').encode('latin1')
+    return bytes(pdf.output())
+
+# Causa con indemnización por años de servicio: se compara por artículo, ya que las
+# causas de la app llevan descripción ("Artículo 161 - Despido sin Causa")
+CAUSA_INDEMNIZACION = re.compile(r'\s*Artículo 161(?!\d)')
 
+@cachear_resultado
 def calcular_finiquito(causa, sueldo_base, dias_trabajados, afp='capital', isapre='banmedica'):
     """Calcular finiquito según causa legal"""
     
@@ -252,7 +1474,7 @@ def calcular_finiquito(causa, sueldo_base, dias_trabajados, afp='capital', isapr
     
     # Indemnización según causa
     indemnizacion = 0
-    if causa == "Artículo 161":
+    if CAUSA_INDEMNIZACION.match(str(causa)):
         # Despido sin causa justificada
         meses_servicio = dias_trabajados / 30
         if meses_servicio >= 12:
@@ -277,6 +1499,7 @@ def calcular_finiquito(causa, sueldo_base, dias_trabajados, afp='capital', isapr
 def evaluar_competencias(candidato, perfil_requerido):
     """Evaluar competencias de un candidato vs perfil requerido"""
     
+    catalogo = cargar_catalogo_competencias()
     resultados = {}
     gaps = {}
     
@@ -296,8 +1519,8 @@ def evaluar_competencias(candidato, perfil_requerido):
                             requerido = perfil_requerido[area][tipo_comp][competencia]
                             actual = candidato[area][tipo_comp][competencia]
                             
-                            nivel_requerido = ["Básico", "Intermedio", "Avanzado", "Experto"].index(requerido)
-                            nivel_actual = ["Básico", "Intermedio", "Avanzado", "Experto"].index(actual)
+                            nivel_requerido = catalogo.codigo_nivel(requerido)
+                            nivel_actual = catalogo.codigo_nivel(actual)
                             
                             gap = max(0, nivel_requerido - nivel_actual)
                             
@@ -337,9 +1560,347 @@ def generar_plan_carrera(gaps, timeframe_meses=12):
     
     return fases
 
+# Reportes PDF
+FUENTE_TITULO = ('Helvetica', 'B', 16)
+FUENTE_SECCION = ('Helvetica', 'B', 12)
+FUENTE_ETIQUETA = ('Helvetica', '', 11)
+FUENTE_VALOR = ('Helvetica', 'B', 11)
+FUENTE_PIE = ('Helvetica', 'I', 8)
+
+def _texto_pdf(valor):
+    """Texto apto para las fuentes base del PDF (latin-1)"""
+    return str(valor).encode('latin-1', 'replace').decode('latin-1')
+
+class DocumentoPDF(FPDF):
+    """Documento con encabezado y pie comunes a los reportes"""
+    
+    def __init__(self, titulo, pie):
+        super().__init__()
+        self.titulo = titulo
+        self.pie = pie
+        self.set_auto_page_break(True, margin=20)
+    
+    def header(self):
+        self.set_font(*FUENTE_TITULO)
+        self.cell(0, 10, self.titulo, align='C', new_x='LMARGIN', new_y='NEXT')
+        self.ln(6)
+    
+    def footer(self):
+        self.set_y(-15)
+        self.set_font(*FUENTE_PIE)
+        self.cell(0, 10, f'{self.pie} - Página {self.page_no()}', align='C')
+
+class PlantillaPDF:
+    """Plantilla de reporte PDF compilada una vez por proceso"""
+    
+    __slots__ = ('titulo', '_operaciones')
+    
+    def __init__(self, titulo, secciones):
+        self.titulo = _texto_pdf(titulo)
+        operaciones = []
+        for seccion in secciones:
+            tipo = seccion[0]
+            if tipo in ('seccion', 'texto'):
+                operaciones.append((tipo, _texto_pdf(seccion[1]), None, None))
+            elif tipo in ('campo', 'total'):
+                _, etiqueta, clave, formato = seccion
+                operaciones.append((tipo, _texto_pdf(f"{etiqueta}:"), clave, formato.format))
+            elif tipo == 'lista':
+                operaciones.append((tipo, _texto_pdf(seccion[1]), seccion[2], None))
+            else:
+                raise ValueError(f"Tipo de sección desconocido: {tipo}")
+        self._operaciones = tuple(operaciones)
+    
+    def documento(self):
+        """Documento vacío con el encabezado de la plantilla"""
+        return DocumentoPDF(self.titulo, f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+    
+    def agregar(self, pdf, campos):
+        """Agregar una página al documento rellenando solo los campos variables"""
+        pdf.add_page()
+        for tipo, texto, clave, formato in self._operaciones:
+            if tipo == 'campo' or tipo == 'total':
+                valor = campos.get(clave)
+                if tipo == 'total':
+                    pdf.ln(2)
+                    pdf.set_font(*FUENTE_SECCION)
+                else:
+                    pdf.set_font(*FUENTE_ETIQUETA)
+                pdf.cell(75, 7, texto)
+                pdf.set_font(*FUENTE_VALOR)
+                pdf.cell(0, 7, 'N/A' if valor is None else _texto_pdf(formato(valor)), new_x='LMARGIN', new_y='NEXT')
+            elif tipo == 'seccion':
+                pdf.ln(3)
+                pdf.set_font(*FUENTE_SECCION)
+                pdf.cell(0, 8, texto, new_x='LMARGIN', new_y='NEXT')
+            elif tipo == 'texto':
+                pdf.set_font(*FUENTE_ETIQUETA)
+                pdf.cell(0, 7, texto, new_x='LMARGIN', new_y='NEXT')
+            else:
+                pdf.ln(3)
+                pdf.set_font(*FUENTE_SECCION)
+                pdf.cell(0, 8, texto, new_x='LMARGIN', new_y='NEXT')
+                pdf.set_font(*FUENTE_ETIQUETA)
+                for item in campos.get(clave) or ['(sin elementos)']:
+                    pdf.multi_cell(0, 7, _texto_pdf(f"- {item}"), new_x='LMARGIN', new_y='NEXT')
+    
+    def generar(self, campos):
+        """PDF de un solo documento como bytes"""
+        pdf = self.documento()
+        self.agregar(pdf, campos)
+        return bytes(pdf.output())
+
+@st.cache_resource
+def obtener_plantillas_pdf():
+    """Plantillas de reportes compiladas una vez por proceso"""
+    moneda = '${:,.0f}'
+    return {
+        'finiquito': PlantillaPDF('FINIQUITO DE TRABAJO', [
+            ('seccion', 'ANTECEDENTES'),
+            ('campo', 'Trabajador', 'trabajador', '{}'),
+            ('campo', 'RUT', 'rut', '{}'),
+            ('campo', 'Causa', 'causa', '{}'),
+            ('campo', 'Sueldo Base', 'sueldo_base', moneda),
+            ('campo', 'Días Trabajados', 'dias_trabajados', '{:.0f}'),
+            ('seccion', 'DETALLE'),
+            ('campo', 'Sueldo por Días', 'sueldo_dias', moneda),
+            ('campo', 'Vacaciones Proporcionales', 'vacaciones_proporcionales', moneda),
+            ('campo', 'Indemnización', 'indemnizacion', moneda),
+            ('total', 'TOTAL FINIQUITO', 'total', moneda),
+            ('campo', 'UF Actual', 'uf_actual', '${:,.2f}'),
+            ('seccion', ''),
+            ('texto', 'Firma Empleador: _________________    Firma Trabajador: _________________')
+        ]),
+        'plan_carrera': PlantillaPDF('PLAN DE DESARROLLO PROFESIONAL', [
+            ('campo', 'Período', 'timeframe', '{}'),
+            ('campo', 'Total Competencias', 'total_competencias', '{}'),
+            ('lista', 'FASE 1 (0-4 meses)', 'Fase 1 (0-4 meses)'),
+            ('lista', 'FASE 2 (4-8 meses)', 'Fase 2 (4-8 meses)'),
+            ('lista', 'FASE 3 (8-12 meses)', 'Fase 3 (8-12 meses)'),
+            ('lista', 'RECOMENDACIONES', 'recomendaciones')
+        ])
+    }
+
+RECOMENDACIONES_PLAN = (
+    'Evaluación trimestral de progreso',
+    'Mentoría para competencias críticas',
+    'Capacitación externa cuando sea necesario',
+    'Seguimiento mensual con el empleado'
+)
+
+def reporte_finiquito_pdf(resultado, sueldo_base, trabajador=None, rut=None):
+    """Reporte PDF de un finiquito calculado con calcular_finiquito"""
+    campos = dict(resultado, sueldo_base=sueldo_base, trabajador=trabajador or None, rut=rut or None)
+    return obtener_plantillas_pdf()['finiquito'].generar(campos)
+
+def reporte_plan_carrera_pdf(plan, timeframe):
+    """Reporte PDF de un plan de carrera generado con generar_plan_carrera"""
+    campos = dict(plan, timeframe=timeframe, recomendaciones=RECOMENDACIONES_PLAN,
+                  total_competencias=sum(len(competencias) for competencias in plan.values()))
+    return obtener_plantillas_pdf()['plan_carrera'].generar(campos)
+
+def calcular_finiquitos_lote(nomina):
+    """Versión vectorizada de calcular_finiquito para una nómina de desvinculaciones"""
+    sueldo_base = pd.to_numeric(nomina['sueldo_base']).to_numpy(dtype=float)
+    dias_trabajados = pd.to_numeric(nomina['dias_trabajados']).to_numpy(dtype=float)
+    causa = nomina['causa'].astype(str)
+    
+    sueldo_diario = sueldo_base / 30
+    sueldo_dias = sueldo_diario * dias_trabajados
+    vacaciones_proporcionales = sueldo_diario * (dias_trabajados * 1.25 / 30)
+    
+    # Indemnización solo por Artículo 161 con 12 meses o más, con tope en UF
+    meses_servicio = dias_trabajados / 30
+    indemnizacion = np.where(
+        causa.str.match(CAUSA_INDEMNIZACION).to_numpy(dtype=bool) & (meses_servicio >= 12),
+        np.minimum(sueldo_base * meses_servicio, IND['uf'] * IND['tope_indemnizacion']),
+        0.0
+    )
+    
+    resultado = pd.DataFrame({
+        'rut': nomina['rut'].to_numpy() if 'rut' in nomina else None,
+        'trabajador': nomina['trabajador'].to_numpy() if 'trabajador' in nomina else None,
+        'causa': causa.to_numpy(),
+        'sueldo_base': sueldo_base,
+        'dias_trabajados': dias_trabajados,
+        'sueldo_dias': sueldo_dias,
+        'vacaciones_proporcionales': vacaciones_proporcionales,
+        'indemnizacion': indemnizacion,
+        'total': sueldo_dias + vacaciones_proporcionales + indemnizacion
+    })
+    resultado['uf_actual'] = IND['uf']
+    return resultado
+
+def generar_finiquitos_lote(nomina, anterior=None):
+    """Emitir los finiquitos de una nómina como un único PDF en un archivo temporal"""
+    if anterior and os.path.exists(anterior):
+        os.remove(anterior)
+    inicio = time.perf_counter()
+    finiquitos = calcular_finiquitos_lote(nomina)
+    plantilla = obtener_plantillas_pdf()['finiquito']
+    
+    pdf = plantilla.documento()
+    columnas = list(finiquitos.columns)
+    for fila in finiquitos.itertuples(index=False, name=None):
+        campos = {clave: (None if pd.isna(valor) else valor) for clave, valor in zip(columnas, fila)}
+        plantilla.agregar(pdf, campos)
+    with tempfile.NamedTemporaryFile('wb', suffix='.pdf', delete=False) as archivo:
+        pdf.output(archivo)
+    
+    return {
+        'pdf': archivo.name,
+        'documentos': len(finiquitos),
+        'bytes': os.path.getsize(archivo.name),
+        'segundos': time.perf_counter() - inicio,
+        'total': float(finiquitos['total'].sum())
+    }
+
+def _clave_cargo(cargos):
+    """Normalizar nombres de cargo para el cruce nómina-perfil"""
+    return pd.Series(cargos, dtype='object').fillna('').astype(str).str.strip().str.casefold()
+
+def perfiles_a_dataframe(perfiles):
+    """Convertir perfiles guardados (dicts del constructor) a un DataFrame de bandas"""
+    
+    return pd.DataFrame({
+        'nombre': [p['nombre'] for p in perfiles],
+        'area': [p['area'] for p in perfiles],
+        'nivel': [p['nivel'] for p in perfiles],
+        'sueldo_min': [p['compensacion']['min'] for p in perfiles],
+        'sueldo_max': [p['compensacion']['max'] for p in perfiles]
+    })
+
+def analizar_bandas_salariales(nomina, perfiles):
+    """Cruzar la nómina con las bandas salariales de los perfiles de cargo"""
+    
+    # Índice ordenado de perfiles (ante cargos repetidos prevalece el último)
+    perfiles = perfiles.assign(clave=_clave_cargo(perfiles['nombre']).to_numpy())
+    perfiles = perfiles.drop_duplicates('clave', keep='last').sort_values('clave')
+    claves_perfil = perfiles['clave'].to_numpy(dtype=str)
+    
+    # Búsqueda binaria de cada empleado en el índice
+    claves_nomina = _clave_cargo(nomina['cargo']).to_numpy(dtype=str)
+    posicion = np.searchsorted(claves_perfil, claves_nomina)
+    posicion = np.minimum(posicion, max(len(claves_perfil) - 1, 0))
+    con_perfil = (claves_perfil[posicion] == claves_nomina) if len(claves_perfil) else np.zeros(len(nomina), bool)
+    
+    def desde_perfil(columna, vacio):
+        valores = perfiles[columna].to_numpy()[posicion] if len(perfiles) else np.full(len(nomina), vacio)
+        return np.where(con_perfil, valores, vacio)
+    
+    sueldo = pd.to_numeric(nomina['sueldo_bruto'], errors='coerce').to_numpy(dtype=float)
+    minimo = pd.to_numeric(desde_perfil('sueldo_min', np.nan), errors='coerce').astype(float)
+    maximo = pd.to_numeric(desde_perfil('sueldo_max', np.nan), errors='coerce').astype(float)
+    
+    # Chequeo de rango y métricas de posicionamiento (sueldo o banda vacíos no cuentan como en banda)
+    sin_dato = np.isnan(sueldo) | np.isnan(minimo) | np.isnan(maximo)
+    estado = np.select(
+        [~con_perfil, sin_dato, sueldo < minimo, sueldo > maximo],
+        ['Sin perfil', 'Sin dato', 'Bajo banda', 'Sobre banda'],
+        default='En banda'
+    )
+    amplitud = maximo - minimo
+    with np.errstate(divide='ignore', invalid='ignore'):
+        compa_ratio = sueldo / ((minimo + maximo) / 2)
+        penetracion = np.where(amplitud > 0, (sueldo - minimo) / amplitud, np.nan)
+    
+    detalle = nomina.copy()
+    detalle['area'] = desde_perfil('area', None)
+    detalle['nivel'] = desde_perfil('nivel', None)
+    detalle['sueldo_min'] = minimo
+    detalle['sueldo_max'] = maximo
+    detalle['estado_banda'] = estado
+    detalle['compa_ratio'] = compa_ratio
+    detalle['penetracion'] = penetracion
+    
+    # Distribuciones por área y nivel
+    con_banda = detalle[con_perfil]
+    agrupado = con_banda.groupby(['area', 'nivel'], sort=True)
+    resumen = agrupado.agg(
+        empleados=('sueldo_bruto', 'size'),
+        bajo_banda=('estado_banda', lambda x: (x == 'Bajo banda').sum()),
+        en_banda=('estado_banda', lambda x: (x == 'En banda').sum()),
+        sobre_banda=('estado_banda', lambda x: (x == 'Sobre banda').sum()),
+        sin_dato=('estado_banda', lambda x: (x == 'Sin dato').sum()),
+        compa_ratio_medio=('compa_ratio', 'mean')
+    )
+    cuantiles = agrupado[['compa_ratio', 'penetracion']].quantile([0.25, 0.5, 0.75]).unstack()
+    cuantiles.columns = [f"{col}_p{int(q * 100)}" for col, q in cuantiles.columns]
+    resumen = resumen.join(cuantiles).reset_index()
+    
+    return {
+        'detalle': detalle,
+        'resumen': resumen,
+        'sin_perfil': int((~con_perfil).sum())
+    }
+
+# Vistas paginadas
+def guardar_vista(clave, datos):
+    """Guardar un resultado en la sesión (como tabla Arrow) para mostrarlo paginado"""
+    if not isinstance(datos, pa.Table):
+        columnas = {}
+        for nombre in datos.columns:
+            try:
+                columnas[str(nombre)] = pa.array(datos[nombre], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Tipos mezclados (p. ej. 3 y '5 años', típico en Excel subidos) se muestran como texto
+                columnas[str(nombre)] = pa.array(datos[nombre].astype('string'), type=pa.string(), from_pandas=True)
+        datos = pa.table(columnas)
+    st.session_state[f"vista_{clave}"] = {'tabla': datos, 'consulta': None, 'resultado': datos}
+
+def obtener_vista(clave):
+    """Tabla completa guardada para una vista, o None"""
+    vista = st.session_state.get(f"vista_{clave}")
+    return None if vista is None else vista['tabla']
+
+def mostrar_vista(clave, filas_por_pagina=25):
+    """Mostrar solo la página visible de un resultado guardado con guardar_vista"""
+    
+    vista = st.session_state.get(f"vista_{clave}")
+    if vista is None:
+        return
+    tabla = vista['tabla']
+    
+    col_filtro, col_orden, col_desc, col_pagina = st.columns([3, 2, 1, 1])
+    with col_filtro:
+        texto = st.text_input("🔎 Filtrar", key=f"{clave}_filtro").strip()
+    with col_orden:
+        orden = st.selectbox("Ordenar por", ["(original)"] + tabla.column_names, key=f"{clave}_orden")
+    with col_desc:
+        descendente = st.checkbox("Descendente", key=f"{clave}_desc")
+    
+    # Recalcular filtro y orden solo cuando cambia la consulta
+    consulta = (texto, orden, descendente)
+    if consulta != vista['consulta']:
+        resultado = tabla
+        if texto:
+            mascara = None
+            for nombre in tabla.column_names:
+                # Celdas vacías no coinciden (un nulo anularía el OR con las demás columnas)
+                coincide = pc.fill_null(pc.match_substring(pc.cast(tabla.column(nombre), pa.string()),
+                                                           texto, ignore_case=True), False)
+                mascara = coincide if mascara is None else pc.or_(mascara, coincide)
+            resultado = resultado.filter(mascara)
+        if orden != "(original)":
+            resultado = resultado.sort_by([(orden, 'descending' if descendente else 'ascending')])
+        vista['consulta'], vista['resultado'] = consulta, resultado
+        st.session_state[f"{clave}_pagina"] = 1
+    
+    resultado = vista['resultado']
+    paginas = max(1, -(-resultado.num_rows // filas_por_pagina))
+    with col_pagina:
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, key=f"{clave}_pagina")
+    
+    inicio = (pagina - 1) * filas_por_pagina
+    st.dataframe(resultado.slice(inicio, filas_por_pagina), use_container_width=True, hide_index=True)
+    st.caption(f"Mostrando {min(inicio + 1, resultado.num_rows)}-{min(inicio + filas_por_pagina, resultado.num_rows)} "
+               f"de {resultado.num_rows} filas (página {pagina}/{paginas}, total {tabla.num_rows})")
+
 def main():
     """Función principal de la aplicación"""
     
+    catalogo = cargar_catalogo_competencias()
+    
     # Header principal
     st.markdown("""
     <div class="main-header">
@@ -351,6 +1912,13 @@ def main():
     # Sidebar con navegación
     st.sidebar.title("🏗️ Módulos del Sistema")
     
+    # Estado de la caché de resultados
+    with st.sidebar.expander("⚡ Caché de Resultados"):
+        if st.button("🧹 Limpiar Caché", use_container_width=True):
+            obtener_cache_resultados().limpiar()
+        # Se completa al final de main() para incluir los cálculos de esta ejecución
+        panel_cache = st.empty()
+    
     # Pestañas principales
     tabs = st.tabs([
         "💰 Calculadora de Sueldos",
@@ -359,7 +1927,12 @@ def main():
         "👥 Evaluación de Candidatos",
         "🎯 Perfiles de Cargo",
         "📊 Análisis de Brechas",
-        "🚀 Planes de Carrera"
+        "🚀 Planes de Carrera",
+        "📉 Escenarios de Costo",
+        "🗂️ Bitácora de Cálculos",
+        "🔄 Conciliación de Períodos",
+        "🏭 Lotes Multiempresa",
+        "⏱️ Asistencia y Horas Extra"
     ])
     
     # TAB 1: CALCULADORA DE SUELDOS
@@ -375,8 +1948,15 @@ def main():
                               format_func=lambda x: x.title())
             isapre = st.selectbox("ISAPRE", options=list(MotorFinanciero().isapre_rates.keys()),
                                  format_func=lambda x: x.title())
-            gratificacion = st.number_input("Gratificación ($)", min_value=0, value=0)
+            gratificacion_legal = st.checkbox("Gratificación legal Art. 50 (25% con tope 4,75 IMM)")
+            gratificacion = st.number_input("Gratificación ($)", min_value=0, value=0,
+                                            disabled=gratificacion_legal)
             horas_extra = st.number_input("Horas Extra ($)", min_value=0, value=0)
+            if gratificacion_legal:
+                gratificacion = round(float(gratificacion_art50(sueldo_bruto + horas_extra)))
+                st.caption(f"Gratificación Art. 50 calculada: ${gratificacion:,.0f} "
+                           f"(tope mensual ${IND['tope_gratificacion'] * IND['imm'] / 12:,.0f})")
+            rut_liquidacion = st.text_input("RUT Trabajador (opcional)", key="rut_liq")
         
         with col2:
             st.subheader("🎯 Cálculo por Objetivo")
@@ -400,6 +1980,16 @@ def main():
                 sueldo_objetivo, afp_objetivo, isapre_objetivo
             )
             
+            # Registro en bitácora
+            bitacora = obtener_bitacora()
+            bitacora.registrar('liquidacion', {
+                'sueldo_bruto': sueldo_bruto, 'afp': afp, 'isapre': isapre,
+                'gratificacion': gratificacion, 'horas_extra': horas_extra
+            }, resultado_directo, rut_liquidacion)
+            bitacora.registrar('sueldo_objetivo', {
+                'sueldo_liquido_objetivo': sueldo_objetivo, 'afp': afp_objetivo, 'isapre': isapre_objetivo
+            }, resultado_objetivo, rut_liquidacion)
+            
             # Mostrar resultados
             st.subheader("📈 Resultados Cálculo Directo")
             
@@ -432,6 +2022,40 @@ def main():
             - **Sueldo líquido calculado:** ${resultado_objetivo['sueldo_liquido_calculado']:,.0f}
             - **Diferencia:** ${resultado_objetivo['diferencia']:,.0f}
             """)
+        
+        with st.expander("📅 Gratificación Anual de la Dotación"):
+            st.write("Sube las remuneraciones mensuales del año (columna rut y una columna por mes)")
+            archivo_historial = st.file_uploader("📂 Historial de Remuneraciones", type=['xlsx', 'csv'],
+                                                 key="historial_gratificacion")
+            regimen = st.selectbox("Régimen", ["art50", "art47"],
+                                   format_func=lambda x: {"art50": "Art. 50 - 25% con tope 4,75 IMM",
+                                                          "art47": "Art. 47 - 30% de la utilidad líquida"}[x])
+            utilidad_liquida = st.number_input("Utilidad Líquida del Ejercicio ($)", min_value=0, value=0,
+                                               disabled=regimen != "art47")
+            
+            if st.button("📅 Calcular Gratificación Anual", use_container_width=True):
+                if archivo_historial is None:
+                    st.warning("⚠️ Sube el historial de remuneraciones")
+                else:
+                    try:
+                        if archivo_historial.name.endswith('.csv'):
+                            historial = pd.read_csv(archivo_historial, dtype={'rut': str})
+                        else:
+                            historial = pd.read_excel(archivo_historial, dtype={'rut': str})
+                        meses_historial = historial.drop(columns=['rut'], errors='ignore')
+                        
+                        gratificaciones = calcular_gratificacion_anual(
+                            meses_historial.to_numpy(dtype=float), regimen, utilidad_liquida=utilidad_liquida)
+                        
+                        detalle_grat = pd.DataFrame(gratificaciones['mensual'], columns=meses_historial.columns)
+                        if 'rut' in historial:
+                            detalle_grat.insert(0, 'rut', historial['rut'].to_numpy())
+                        detalle_grat['total_anual'] = gratificaciones['anual']
+                        
+                        st.metric("Gratificación Total Anual", f"${gratificaciones['total']:,.0f}")
+                        st.dataframe(detalle_grat, use_container_width=True)
+                    except Exception as e:
+                        st.error(f"❌ Error calculando gratificación: {str(e)}")
     
     # TAB 2: GENERACIÓN DE DOCUMENTOS
     with tabs[1]:
@@ -458,11 +2082,15 @@ def main():
                 jornada = st.selectbox("Jornada", ["Completa", "Parcial", "Por Turnos"])
                 lugar = st.text_input("Lugar de Trabajo", value="Empresa")
             
-            if st.button("📄 Generar Contrato", use_container_width=True):
+            rut_normalizado, rut_valido = validar_rut(rut)
+            if rut and not rut_valido:
+                st.warning("⚠️ RUT inválido: revisa el dígito verificador")
+            
+            if st.button("📄 Generar Contrato", use_container_width=True, disabled=bool(rut) and not rut_valido):
                 datos = {
                     'empresa': empresa,
                     'trabajador': trabajador,
-                    'rut': rut,
+                    'rut': rut_normalizado or rut,
                     'cargo': cargo,
                     'fecha_inicio': fecha_inicio.strftime("%d/%m/%Y"),
                     'sueldo': f"{sueldo:,.0f}",
@@ -498,6 +2126,9 @@ def main():
                 fecha_amo = st.date_input("Fecha Amonestación", key="fecha_amo")
                 motivo_amo = st.text_area("Motivo de la Amonestación", height=100)
             
+            if rut_amo and not validar_rut(rut_amo)[1]:
+                st.warning("⚠️ RUT inválido: revisa el dígito verificador")
+            
             if st.button("📄 Generar Carta de Amonestación", use_container_width=True):
                 st.info("🛠️ Funcionalidad en desarrollo - Estructura de carta de amonestación implementada")
         
@@ -515,6 +2146,9 @@ def main():
                 fecha_desv = st.date_input("Fecha de Desvinculación", key="fecha_desv")
                 motivo_desv = st.text_area("Motivo de Desvinculación", height=100, key="motivo_desv")
             
+            if rut_desv and not validar_rut(rut_desv)[1]:
+                st.warning("⚠️ RUT inválido: revisa el dígito verificador")
+            
             if st.button("📄 Generar Carta de Desvinculación", use_container_width=True):
                 st.info("🛠️ Funcionalidad en desarrollo - Estructura de carta de desvinculación implementada")
     
@@ -542,6 +2176,7 @@ def main():
                                    format_func=lambda x: x.title(), key="afp_finiq")
             isapre_finiq = st.selectbox("ISAPRE", options=list(MotorFinanciero().isapre_rates.keys()),
                                       format_func=lambda x: x.title(), key="isapre_finiq")
+            rut_finiq = st.text_input("RUT Trabajador (opcional)", key="rut_finiq")
         
         with col2:
             st.subheader("💰 Indicadores Actuales")
@@ -559,63 +2194,108 @@ def main():
                 resultado_finiq = calcular_finiquito(
                     causa, sueldo_base, dias_trabajados, afp_finiq, isapre_finiq
                 )
+                obtener_bitacora().registrar('finiquito', {
+                    'causa': causa, 'sueldo_base': sueldo_base, 'dias_trabajados': dias_trabajados,
+                    'afp': afp_finiq, 'isapre': isapre_finiq
+                }, resultado_finiq, rut_finiq)
                 
-                st.subheader("📈 Detalle del Finiquito")
-                
-                fin_col1, fin_col2, fin_col3 = st.columns(3)
-                
-                with fin_col1:
-                    st.metric("Sueldo por Días", f"${resultado_finiq['sueldo_dias']:,.0f}")
-                    st.metric("Días Trabajados", f"{resultado_finiq['dias_trabajados']} días")
-                
-                with fin_col2:
-                    st.metric("Vacaciones Proporcionales", f"${resultado_finiq['vacaciones_proporcionales']:,.0f}")
-                    st.metric("Factor Vacaciones", "1.25 días/mes")
-                
-                with fin_col3:
-                    if resultado_finiq['indemnizacion'] > 0:
-                        st.metric("Indemnización", f"${resultado_finiq['indemnizacion']:,.0f}")
-                    else:
-                        st.metric("Indemnización", "$0")
-                
-                # Total destacado
-                st.markdown(f"""
-                <div class="success-msg">
-                    <h3>💰 TOTAL FINIQUITO: ${resultado_finiq['total']:,.0f}</h3>
-                    <p><strong>Causa:</strong> {resultado_finiq['causa']}</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Descargar reporte
-                if st.button("📥 Descargar Reporte Finiquito", use_container_width=True):
-                    reporte = f"""
-REPORTE DE FINIQUITO
-====================
-
-Causa: {resultado_finiq['causa']}
-Sueldo Base: ${sueldo_base:,.0f}
-Días Trabajados: {dias_trabajados}
-
-DETALLE:
-- Sueldo por Días: ${resultado_finiq['sueldo_dias']:,.0f}
-- Vacaciones Proporcionales: ${resultado_finiq['vacaciones_proporcionales']:,.0f}
-- Indemnización: ${resultado_finiq['indemnizacion']:,.0f}
-
-TOTAL: ${resultado_finiq['total']:,.0f}
-
-UF Actual: ${IND['uf']:,.2f}
-Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
-"""
-                    
-                    st.download_button(
-                        label="📥 Descargar Reporte",
-                        data=reporte,
-                        file_name=f"finiquito_{datetime.now().strftime('%Y%m%d_%H%M')}.txt",
-                        mime="text/plain"
-                    )
+                # El reporte se arma al calcular para que la descarga no dependa de otro botón
+                st.session_state['finiquito'] = {
+                    'resultado': resultado_finiq,
+                    'reporte': reporte_finiquito_pdf(resultado_finiq, sueldo_base, rut=rut_finiq)
+                }
             
             except Exception as e:
                 st.error(f"❌ Error calculando finiquito: {str(e)}")
+        
+        if 'finiquito' in st.session_state:
+            resultado_finiq = st.session_state['finiquito']['resultado']
+            
+            st.subheader("📈 Detalle del Finiquito")
+            
+            fin_col1, fin_col2, fin_col3 = st.columns(3)
+            
+            with fin_col1:
+                st.metric("Sueldo por Días", f"${resultado_finiq['sueldo_dias']:,.0f}")
+                st.metric("Días Trabajados", f"{resultado_finiq['dias_trabajados']} días")
+            
+            with fin_col2:
+                st.metric("Vacaciones Proporcionales", f"${resultado_finiq['vacaciones_proporcionales']:,.0f}")
+                st.metric("Factor Vacaciones", "1.25 días/mes")
+            
+            with fin_col3:
+                if resultado_finiq['indemnizacion'] > 0:
+                    st.metric("Indemnización", f"${resultado_finiq['indemnizacion']:,.0f}")
+                else:
+                    st.metric("Indemnización", "$0")
+            
+            # Total destacado
+            st.markdown(f"""
+            <div class="success-msg">
+                <h3>💰 TOTAL FINIQUITO: ${resultado_finiq['total']:,.0f}</h3>
+                <p><strong>Causa:</strong> {resultado_finiq['causa']}</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            st.download_button(
+                label="📥 Descargar Reporte Finiquito (PDF)",
+                data=st.session_state['finiquito']['reporte'],
+                file_name=f"finiquito_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
+                mime="application/pdf",
+                use_container_width=True
+            )
+        
+        with st.expander("📦 Finiquitos en Lote"):
+            st.info("💡 Sube una nómina de desvinculaciones (columnas: causa, sueldo_base, dias_trabajados "
+                    "y opcionalmente rut, trabajador) o usa una nómina de ejemplo; se emite un único PDF "
+                    "con un finiquito por página")
+            
+            archivo_finiquitos = st.file_uploader("📂 Nómina de Desvinculaciones (Excel o CSV)",
+                                                  type=['xlsx', 'csv'], key="archivo_finiquitos")
+            
+            if st.button("📄 Generar Finiquitos en Lote", use_container_width=True):
+                try:
+                    if archivo_finiquitos is not None:
+                        if archivo_finiquitos.name.endswith('.csv'):
+                            nomina_finiquitos = pd.read_csv(archivo_finiquitos, dtype={'rut': str})
+                        else:
+                            nomina_finiquitos = pd.read_excel(archivo_finiquitos, dtype={'rut': str})
+                    else:
+                        rng = np.random.default_rng(0)
+                        nomina_finiquitos = pd.DataFrame({
+                            'trabajador': [f"Trabajador {i + 1}" for i in range(1000)],
+                            'causa': rng.choice(["Artículo 159 - Renuncia Voluntaria", "Artículo 161 - Despido sin Causa"], 1000),
+                            'sueldo_base': rng.uniform(IND['imm'], 3000000, 1000).round(-3),
+                            'dias_trabajados': rng.integers(1, 31, 1000)
+                        })
+                    
+                    # El PDF queda en disco; la sesión guarda solo la ruta y el resumen
+                    anterior = st.session_state.get('finiquitos_lote', {}).get('pdf')
+                    st.session_state['finiquitos_lote'] = generar_finiquitos_lote(nomina_finiquitos, anterior)
+                
+                except Exception as e:
+                    st.error(f"❌ Error generando finiquitos: {str(e)}")
+            
+            if 'finiquitos_lote' in st.session_state:
+                lote = st.session_state['finiquitos_lote']
+                
+                col_lote1, col_lote2, col_lote3 = st.columns(3)
+                with col_lote1:
+                    st.metric("Finiquitos Emitidos", f"{lote['documentos']:,}")
+                with col_lote2:
+                    st.metric("Finiquitos por Minuto", f"{lote['documentos'] / max(lote['segundos'], 1e-9) * 60:,.0f}")
+                with col_lote3:
+                    st.metric("Total a Pagar", f"${lote['total']:,.0f}")
+                
+                if os.path.exists(lote['pdf']):
+                    with open(lote['pdf'], 'rb') as archivo_pdf:
+                        st.download_button(
+                            label="📥 Descargar Finiquitos (PDF)",
+                            data=archivo_pdf,
+                            file_name=f"finiquitos_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
+                            mime="application/pdf",
+                            use_container_width=True
+                        )
     
     # TAB 4: EVALUACIÓN DE CANDIDATOS
     with tabs[3]:
@@ -672,12 +2352,10 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
                 # Seleccionar competencias a evaluar
                 if st.checkbox("Usar Competencias Estándar"):
                     area_evaluacion = st.selectbox("Área de Evaluación", 
-                                                 list(COMPETENCIAS_BASE.keys()))
+                                                 catalogo.areas)
                     
                     # Simular evaluación básica
                     if st.button("🎯 Evaluar Candidatos", use_container_width=True):
-                        st.subheader("📈 Resultados de Evaluación")
-                        
                         # Crear scores simulados para demo
                         candidatos_df['Score_Total'] = np.random.uniform(60, 95, len(candidatos_df))
                         candidatos_df['Recomendación'] = candidatos_df['Score_Total'].apply(
@@ -687,18 +2365,23 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
                                      else 'No Recomendado'
                         )
                         
-                        # Mostrar ranking
-                        ranking = candidatos_df.sort_values('Score_Total', ascending=False)
+                        # Registro en bitácora
+                        bitacora = obtener_bitacora()
+                        for candidato in candidatos_df.to_dict('records'):
+                            bitacora.registrar('evaluacion_candidato', {'area_evaluacion': area_evaluacion},
+                                               candidato, str(candidato.get('RUT', '')))
                         
-                        for i, (_, candidato) in enumerate(ranking.iterrows(), 1):
-                            color = "🟢" if candidato['Score_Total'] >= 85 else "🟡" if candidato['Score_Total'] >= 75 else "🟠"
-                            
-                            st.markdown(f"""
-                            **{i}. {color} {candidato['Nombre']}**
-                            - **Score:** {candidato['Score_Total']:.1f}/100
-                            - **Recomendación:** {candidato['Recomendación']}
-                            - **Área:** {candidato['Área']}
-                            """)
+                        # Ranking como tabla para la vista paginada
+                        ranking = candidatos_df.sort_values('Score_Total', ascending=False, ignore_index=True)
+                        ranking.insert(0, 'Posición', np.arange(1, len(ranking) + 1))
+                        ranking.insert(1, 'Semáforo', np.select(
+                            [ranking['Score_Total'] >= 85, ranking['Score_Total'] >= 75], ['🟢', '🟡'], default='🟠'))
+                        ranking['Score_Total'] = ranking['Score_Total'].round(1)
+                        guardar_vista('ranking_candidatos', ranking)
+                    
+                    if obtener_vista('ranking_candidatos') is not None:
+                        st.subheader("📈 Resultados de Evaluación")
+                        mostrar_vista('ranking_candidatos')
             
             except Exception as e:
                 st.error(f"❌ Error procesando archivo: {str(e)}")
@@ -713,7 +2396,7 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
             st.subheader("📋 Información Básica")
             
             nombre_cargo = st.text_input("Nombre del Cargo")
-            area_cargo = st.selectbox("Área Funcional", list(COMPETENCIAS_BASE.keys()))
+            area_cargo = st.selectbox("Área Funcional", catalogo.areas)
             nivel_cargo = st.selectbox("Nivel", ["Junior", "Semi Senior", "Senior", "Lead", "Manager"])
             modalidad = st.selectbox("Modalidad", ["Presencial", "Híbrida", "Remota"])
             
@@ -726,9 +2409,10 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
             
             competencias_seleccionadas = {}
             
-            for tipo in ['técnicas', 'blandas']:
+            for tipo in catalogo.tipos_de(area_cargo):
                 st.write(f"**{tipo.title()}:**")
-                for comp, niveles in COMPETENCIAS_BASE[area_cargo][tipo].items():
+                for comp in catalogo.competencias(area_cargo, tipo):
+                    niveles = catalogo.niveles_de(area_cargo, tipo, comp)
                     nivel_req = st.selectbox(f"{comp}", niveles, key=f"{tipo}_{comp}")
                     competencias_seleccionadas[f"{tipo}_{comp}"] = nivel_req
             
@@ -753,6 +2437,10 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
                     'fecha_creacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
                 
+                if 'perfiles_cargo' not in st.session_state:
+                    st.session_state['perfiles_cargo'] = {}
+                st.session_state['perfiles_cargo'][nombre_cargo.strip().casefold()] = perfil_completo
+                
                 st.success("✅ Perfil guardado correctamente")
                 
                 # Mostrar resumen
@@ -776,6 +2464,70 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
                 """)
             else:
                 st.error("❌ Por favor completa los campos obligatorios")
+        
+        st.markdown("---")
+        st.subheader("📏 Análisis de Bandas Salariales")
+        
+        perfiles_guardados = list(st.session_state.get('perfiles_cargo', {}).values())
+        st.write(f"**Perfiles guardados en la sesión:** {len(perfiles_guardados)}")
+        
+        col_banda1, col_banda2 = st.columns(2)
+        
+        with col_banda1:
+            archivo_nomina_bandas = st.file_uploader(
+                "📂 Nómina (columnas: cargo, sueldo_bruto)", type=['xlsx', 'csv'], key="nomina_bandas")
+        
+        with col_banda2:
+            archivo_perfiles = st.file_uploader(
+                "📂 Perfiles adicionales (nombre, area, nivel, sueldo_min, sueldo_max)",
+                type=['xlsx', 'csv'], key="perfiles_bandas")
+        
+        if st.button("📏 Analizar Bandas", use_container_width=True):
+            try:
+                if archivo_nomina_bandas is None:
+                    st.warning("⚠️ Sube la nómina a analizar")
+                else:
+                    def leer_tabla(archivo):
+                        if archivo.name.endswith('.csv'):
+                            return pd.read_csv(archivo)
+                        return pd.read_excel(archivo)
+                    
+                    nomina_bandas = leer_tabla(archivo_nomina_bandas)
+                    tablas_perfiles = []
+                    if archivo_perfiles is not None:
+                        tablas_perfiles.append(leer_tabla(archivo_perfiles))
+                    if perfiles_guardados:
+                        tablas_perfiles.append(perfiles_a_dataframe(perfiles_guardados))
+                    
+                    if not tablas_perfiles:
+                        st.warning("⚠️ Guarda o sube al menos un perfil de cargo")
+                    else:
+                        bandas = analizar_bandas_salariales(nomina_bandas, pd.concat(tablas_perfiles, ignore_index=True))
+                        detalle_bandas = bandas['detalle']
+                        
+                        met_b1, met_b2, met_b3, met_b4 = st.columns(4)
+                        with met_b1:
+                            st.metric("Bajo Banda", int((detalle_bandas['estado_banda'] == 'Bajo banda').sum()))
+                        with met_b2:
+                            st.metric("En Banda", int((detalle_bandas['estado_banda'] == 'En banda').sum()))
+                        with met_b3:
+                            st.metric("Sobre Banda", int((detalle_bandas['estado_banda'] == 'Sobre banda').sum()))
+                        with met_b4:
+                            st.metric("Sin Perfil", bandas['sin_perfil'])
+                        
+                        sin_dato_bandas = int((detalle_bandas['estado_banda'] == 'Sin dato').sum())
+                        if sin_dato_bandas:
+                            st.warning(f"⚠️ {sin_dato_bandas} empleado(s) sin sueldo o con banda incompleta "
+                                       "en el perfil: no se clasifican")
+                        
+                        st.write("**Distribución por Área y Nivel**")
+                        st.dataframe(bandas['resumen'], use_container_width=True)
+                        
+                        st.write("**Detalle por Empleado**")
+                        st.dataframe(detalle_bandas, use_container_width=True)
+            
+            except Exception as e:
+                st.error(f"❌ Error analizando bandas: {str(e)}")
     
     # TAB 6: ANÁLISIS DE BRECHAS
     with tabs[5]:
@@ -788,70 +2540,50 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
         with col1:
             st.write("**Competencias Actuales del Empleado**")
             
-            # Simular competencias actuales
-            empleado_actual = {}
-            for area in COMPETENCIAS_BASE:
-                empleado_actual[area] = {}
-                for tipo in COMPETENCIAS_BASE[area]:
-                    empleado_actual[area][tipo] = {}
-                    for comp in COMPETENCIAS_BASE[area][tipo]:
-                        # Simular niveles actuales
-                        nivel_actual = np.random.choice(COMPETENCIAS_BASE[area][tipo][comp])
-                        empleado_actual[area][tipo][comp] = nivel_actual
+            # Simular competencias actuales (un código de nivel por competencia)
+            nivel_min, nivel_max = catalogo.rangos_nivel()
+            empleado_actual = catalogo.a_perfil(np.random.randint(nivel_min, nivel_max + 1))
         
         with col2:
             st.write("**Competencias Requeridas (Perfil Objetivo)**")
             
             # Simular competencias requeridas
-            perfil_requerido = {}
-            for area in COMPETENCIAS_BASE:
-                perfil_requerido[area] = {}
-                for tipo in COMPETENCIAS_BASE[area]:
-                    perfil_requerido[area][tipo] = {}
-                    for comp in COMPETENCIAS_BASE[area][tipo]:
-                        # Simular niveles requeridos (generalmente más altos)
-                        nivel_requerido = np.random.choice(COMPETENCIAS_BASE[area][tipo][comp])
-                        perfil_requerido[area][tipo][comp] = nivel_requerido
+            perfil_requerido = catalogo.a_perfil(np.random.randint(nivel_min, nivel_max + 1))
         
         if st.button("📊 Analizar Brechas", use_container_width=True):
             # Evaluación de brechas
             resultados, gaps = evaluar_competencias(empleado_actual, perfil_requerido)
+            obtener_bitacora().registrar('analisis_brechas', {
+                'actual': empleado_actual, 'requerido': perfil_requerido
+            }, resultados)
             
+            # Brechas como tabla (área, tipo, competencia, gap) para la vista paginada
+            filas_gaps = [
+                (area, tipo, comp, gap)
+                for area in gaps for tipo in gaps[area] for comp, gap in gaps[area][tipo].items() if gap > 0
+            ]
+            tabla_gaps = pd.DataFrame(filas_gaps, columns=['Área', 'Tipo', 'Competencia', 'Gap'])
+            tabla_gaps.insert(0, 'Semáforo', np.where(tabla_gaps['Gap'] >= 2, '🔴', '🟡'))
+            guardar_vista('brechas', tabla_gaps)
+        
+        tabla_gaps = obtener_vista('brechas')
+        if tabla_gaps is not None:
             st.subheader("📈 Resultados del Análisis")
             
-            total_gaps = sum(len([gap for gap in area_gaps.values() if gap > 0]) 
-                           for area_gaps in gaps.values() if area_gaps)
-            
+            gap_por_fila = tabla_gaps.column('Gap')
             col_met1, col_met2, col_met3 = st.columns(3)
             
             with col_met1:
-                st.metric("Total de Gaps", total_gaps)
+                st.metric("Total de Gaps", tabla_gaps.num_rows)
             
             with col_met2:
-                gaps_criticos = sum(1 for area in gaps.values() 
-                                  for tipo in area.values() 
-                                  for gap in tipo.values() 
-                                  if gap >= 2)
-                st.metric("Gaps Críticos (≥2 niveles)", gaps_criticos)
+                st.metric("Gaps Críticos (≥2 niveles)", pc.sum(pc.greater_equal(gap_por_fila, 2)).as_py() or 0)
             
             with col_met3:
-                areas_afectadas = len([area for area in gaps.values() 
-                                     if any(gap > 0 for tipo in area.values() 
-                                           for gap in tipo.values())])
-                st.metric("Áreas Afectadas", f"{areas_afectadas}/{len(COMPETENCIAS_BASE)}")
-            
-            # Mostrar brechas por área
-            for area in gaps:
-                if any(gap > 0 for tipo in gaps[area].values() for gap in tipo.values()):
-                    st.subheader(f"🎯 {area}")
-                    
-                    for tipo in gaps[area]:
-                        gaps_tipo = {k: v for k, v in gaps[area][tipo].items() if v > 0}
-                        if gaps_tipo:
-                            st.write(f"**{tipo.title()}:**")
-                            for comp, gap in gaps_tipo.items():
-                                color = "🔴" if gap >= 2 else "🟡" if gap == 1 else "🟢"
-                                st.write(f"  {color} {comp}: Gap de {gap} nivel(es)")
+                areas_afectadas = len(pc.unique(tabla_gaps.column('Área')))
+                st.metric("Áreas Afectadas", f"{areas_afectadas}/{len(catalogo.areas)}")
+            
+            mostrar_vista('brechas')
     
     # TAB 7: PLANES DE CARRERA
     with tabs[6]:
@@ -876,15 +2608,22 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
         
         if st.button("🎯 Generar Plan de Carrera", use_container_width=True):
             plan = generar_plan_carrera(gaps_simulados, 12)
+            st.session_state['plan_carrera'] = {
+                'plan': plan,
+                'timeframe': timeframe,
+                'reporte': reporte_plan_carrera_pdf(plan, timeframe)
+            }
+            guardar_vista('plan_carrera', pd.DataFrame(
+                [(fase, comp) for fase, competencias in plan.items() for comp in competencias],
+                columns=['Fase', 'Competencia']
+            ))
+        
+        if 'plan_carrera' in st.session_state:
+            plan = st.session_state['plan_carrera']['plan']
+            timeframe = st.session_state['plan_carrera']['timeframe']
             
             st.subheader("📅 Plan de Desarrollo en Fases")
-            
-            for fase, competencias in plan.items():
-                if competencias:
-                    st.markdown(f"### {fase}")
-                    for comp in competencias:
-                        st.write(f"- {comp}")
-                    st.write("")
+            mostrar_vista('plan_carrera')
             
             # Métricas del plan
             total_competencias = sum(len(competencias) for competencias in plan.values())
@@ -902,40 +2641,375 @@ Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}
                 st.metric("Tiempo Estimado", timeframe)
             
             # Plan detallado
-            if st.button("📋 Ver Plan Detallado", use_container_width=True):
-                plan_detallado = f"""
-PLAN DE DESARROLLO PROFESIONAL
-==============================
-
-Período: {timeframe}
-Total Competencias: {total_competencias}
-
-FASE 1 (0-4 meses):
-{chr(10).join([f"- {comp}" for comp in plan['Fase 1 (0-4 meses)']])}
-
-FASE 2 (4-8 meses):
-{chr(10).join([f"- {comp}" for comp in plan['Fase 2 (4-8 meses)']])}
-
-FASE 3 (8-12 meses):
-{chr(10).join([f"- {comp}" for comp in plan['Fase 3 (8-12 meses)']])}
-
-RECOMENDACIONES:
-- Evaluación trimestral de progreso
-- Mentoría para competencias críticas
-- Capacitación externa cuando sea necesario
-- Seguimiento mensual con el empleado
-
-Generado: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}
-"""
+            st.download_button(
+                label="📥 Descargar Plan de Carrera (PDF)",
+                data=st.session_state['plan_carrera']['reporte'],
+                file_name=f"plan_carrera_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
+                mime="application/pdf",
+                use_container_width=True
+            )
+    
+    # TAB 8: ESCENARIOS DE COSTO
+    with tabs[7]:
+        st.header("📉 Simulación de Escenarios de Costo de Planilla")
+        
+        st.info("💡 Sube la dotación actual (columnas: sueldo_bruto, afp, isapre y opcionalmente "
+                "gratificacion, horas_extra, otros_haberes) o usa una dotación de ejemplo")
+        
+        archivo_dotacion = st.file_uploader("📂 Subir dotación (Excel o CSV)", type=['xlsx', 'csv'],
+                                            key="archivo_dotacion")
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.subheader("📈 UF")
+            inflacion_uf = st.number_input("Inflación UF Mensual (%)", value=0.3, step=0.1)
+            volatilidad_uf = st.number_input("Volatilidad UF (%)", min_value=0.0, value=0.2, step=0.1)
+        
+        with col2:
+            st.subheader("💵 IMM")
+            reajuste_imm = st.number_input("Reajuste IMM (%)", value=5.0, step=0.5)
+            mes_imm = st.number_input("Mes del Reajuste IMM", min_value=1, max_value=36, value=5)
+            volatilidad_imm = st.number_input("Volatilidad IMM (%)", min_value=0.0, value=1.0, step=0.5)
+        
+        with col3:
+            st.subheader("👥 Sueldos")
+            reajuste_sueldos = st.number_input("Reajuste de Sueldos (%)", value=4.0, step=0.5)
+            mes_sueldos = st.number_input("Mes del Reajuste de Sueldos", min_value=1, max_value=36, value=1)
+            volatilidad_sueldos = st.number_input("Volatilidad Reajuste (%)", min_value=0.0, value=1.0, step=0.5)
+        
+        col_esc1, col_esc2 = st.columns(2)
+        with col_esc1:
+            n_escenarios = st.number_input("Número de Escenarios", min_value=1, max_value=100000, value=1000,
+                                           help="Con volatilidades en cero basta un escenario determinístico")
+        with col_esc2:
+            meses_simulacion = st.number_input("Meses a Simular", min_value=1, max_value=36, value=12)
+        regimen_escenarios = st.selectbox("Gratificación en Escenarios", ["Columna de la dotación", "Art. 50"],
+                                          help="Art. 50 recalcula la gratificación con el IMM de cada escenario")
+        
+        if st.button("🎲 Simular Escenarios", use_container_width=True):
+            try:
+                if archivo_dotacion is not None:
+                    if archivo_dotacion.name.endswith('.csv'):
+                        dotacion_df = pd.read_csv(archivo_dotacion)
+                    else:
+                        dotacion_df = pd.read_excel(archivo_dotacion)
+                else:
+                    rng = np.random.default_rng(0)
+                    dotacion_df = pd.DataFrame({
+                        'sueldo_bruto': rng.uniform(IND['imm'], 3000000, 1000).round(-3),
+                        'afp': rng.choice(list(MotorFinanciero().afp_rates.keys()), 1000),
+                        'isapre': rng.choice(list(MotorFinanciero().isapre_rates.keys()), 1000)
+                    })
+                
+                inicio = time.perf_counter()
+                escenarios = generar_escenarios(
+                    int(n_escenarios), int(meses_simulacion),
+                    inflacion_uf, volatilidad_uf,
+                    reajuste_imm, int(mes_imm) - 1, volatilidad_imm,
+                    reajuste_sueldos, int(mes_sueldos) - 1, volatilidad_sueldos
+                )
+                simulacion = simular_costo_planilla(
+                    dotacion_df, escenarios,
+                    regimen_gratificacion='art50' if regimen_escenarios == "Art. 50" else None
+                )
+                duracion = time.perf_counter() - inicio
+                
+                bandas = simulacion['bandas']
+                costo = bandas[bandas['metrica'] == 'costo_empleador'].set_index('mes')
+                liquido = bandas[bandas['metrica'] == 'liquido'].set_index('mes')
                 
-                st.text(plan_detallado)
+                # Percentiles del costo acumulado por escenario (no la suma de percentiles mensuales)
+                costo_horizonte = np.percentile(simulacion['totales']['costo_empleador'].sum(axis=1), [50, 95])
                 
-                st.download_button(
-                    label="📥 Descargar Plan de Carrera",
-                    data=plan_detallado,
-                    file_name=f"plan_carrera_{datetime.now().strftime('%Y%m%d_%H%M')}.txt",
-                    mime="text/plain"
+                met_col1, met_col2, met_col3 = st.columns(3)
+                with met_col1:
+                    st.metric(f"Costo Empleador {simulacion['meses']} Meses (P50)", f"${costo_horizonte[0]:,.0f}")
+                with met_col2:
+                    st.metric(f"Costo Empleador {simulacion['meses']} Meses (P95)", f"${costo_horizonte[1]:,.0f}")
+                with met_col3:
+                    st.metric("Tiempo de Simulación", f"{duracion:.2f} s")
+                
+                st.subheader("🏢 Costo Mensual Empleador (bandas P5-P50-P95)")
+                st.line_chart(costo[['p5', 'p50', 'p95']])
+                
+                st.subheader("👤 Líquido Mensual Trabajadores (bandas P5-P50-P95)")
+                st.line_chart(liquido[['p5', 'p50', 'p95']])
+                
+                st.caption(f"{simulacion['n_escenarios']:,} escenarios × {simulacion['n_empleados']:,} "
+                           f"empleados × {simulacion['meses']} meses")
+                st.dataframe(bandas, use_container_width=True)
+            
+            except Exception as e:
+                st.error(f"❌ Error simulando escenarios: {str(e)}")
+    
+    # TAB 9: BITÁCORA DE CÁLCULOS
+    with tabs[8]:
+        st.header("🗂️ Bitácora de Auditoría de Cálculos")
+        
+        bitacora = obtener_bitacora()
+        
+        bit_col1, bit_col2, bit_col3 = st.columns(3)
+        with bit_col1:
+            st.metric("Registros Escritos", bitacora.escritos)
+        with bit_col2:
+            st.metric("Pendientes de Escritura", bitacora.pendientes())
+        with bit_col3:
+            st.metric("Archivos Parquet", bitacora.archivos)
+        
+        if not bitacora.activa():
+            st.error("❌ El escritor de la bitácora está detenido: los nuevos registros no se guardarán")
+        elif bitacora.fallos_consecutivos:
+            st.warning(f"⚠️ Error escribiendo la bitácora ({bitacora.fallos_consecutivos} intento(s)); "
+                       f"los registros se conservan para reintentar: {bitacora.ultimo_error}")
+        if bitacora.descartados:
+            st.warning(f"⚠️ {bitacora.descartados} registro(s) descartados por no poder escribirse")
+        
+        st.subheader("🔍 Consultar Bitácora")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            rut_consulta = st.text_input("RUT", key="rut_bitacora")
+            tipo_consulta = st.selectbox("Tipo de Cálculo", [
+                "Todos", "liquidacion", "sueldo_objetivo", "finiquito",
+                "evaluacion_candidato", "analisis_brechas"
+            ])
+        with col2:
+            fecha_desde = st.date_input("Desde", value=datetime.now() - timedelta(days=30), key="bitacora_desde")
+            fecha_hasta = st.date_input("Hasta", value=datetime.now(), key="bitacora_hasta")
+        
+        if st.button("🔍 Consultar", use_container_width=True):
+            try:
+                if not bitacora.vaciar(timeout=5):
+                    st.warning("⚠️ Hay registros pendientes de escritura; la consulta puede no incluirlos")
+                registros = bitacora.consultar(
+                    rut=rut_consulta.strip() or None,
+                    desde=datetime.combine(fecha_desde, datetime.min.time()),
+                    hasta=datetime.combine(fecha_hasta, datetime.max.time()),
+                    tipo=None if tipo_consulta == "Todos" else tipo_consulta
                 )
+                st.write(f"**{len(registros)} registro(s) encontrados**")
+                st.dataframe(registros, use_container_width=True)
+            except Exception as e:
+                st.error(f"❌ Error consultando bitácora: {str(e)}")
+    
+    # TAB 10: CONCILIACIÓN DE PERÍODOS
+    with tabs[9]:
+        st.header("🔄 Conciliación de Liquidaciones entre Períodos")
+        
+        st.info("💡 Sube la nómina de cada período (rut, sueldo_bruto, afp, isapre, gratificacion, "
+                "horas_extra, otros_haberes) o el resultado de una corrida anterior con la columna 'liquido'")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            archivo_anterior = st.file_uploader("📂 Período Anterior", type=['xlsx', 'csv'], key="conc_anterior")
+        with col2:
+            archivo_actual = st.file_uploader("📂 Período Actual", type=['xlsx', 'csv'], key="conc_actual")
+        
+        if st.button("🔄 Conciliar Períodos", use_container_width=True):
+            if archivo_anterior is None or archivo_actual is None:
+                st.warning("⚠️ Sube ambos períodos")
+            else:
+                try:
+                    motor = MotorFinanciero()
+                    inicio = time.perf_counter()
+                    
+                    def cargar_corrida(archivo):
+                        if archivo.name.endswith('.csv'):
+                            tabla = pd.read_csv(archivo, dtype={'rut': str})
+                        else:
+                            tabla = pd.read_excel(archivo, dtype={'rut': str})
+                        return tabla if 'liquido' in tabla else motor.calcular_liquidacion_lote(tabla)
+                    
+                    conciliacion = conciliar_liquidaciones(cargar_corrida(archivo_anterior),
+                                                           cargar_corrida(archivo_actual))
+                    conciliacion['segundos'] = time.perf_counter() - inicio
+                    
+                    # El detalle queda en el servidor: vista paginada y CSV escrito por bloques a disco
+                    anterior = st.session_state.get('conciliacion', {}).get('csv')
+                    conciliacion['csv'] = escribir_csv_temporal(conciliacion['detalle'], anterior)
+                    guardar_vista('conciliacion', conciliacion.pop('detalle'))
+                    guardar_vista('conciliacion_observaciones', conciliacion.pop('observaciones'))
+                    st.session_state['conciliacion'] = conciliacion
+                except Exception as e:
+                    st.error(f"❌ Error conciliando períodos: {str(e)}")
+        
+        if 'conciliacion' in st.session_state:
+            conciliacion = st.session_state['conciliacion']
+            
+            conteo = conciliacion['conteo']
+            met_c1, met_c2, met_c3, met_c4 = st.columns(4)
+            with met_c1:
+                st.metric("Continúan", conteo.get('Continúa', 0))
+            with met_c2:
+                st.metric("Altas", conteo.get('Alta', 0))
+            with met_c3:
+                st.metric("Bajas", conteo.get('Baja', 0))
+            with met_c4:
+                st.metric("Tiempo", f"{conciliacion['segundos']:.2f} s")
+            
+            observaciones = obtener_vista('conciliacion_observaciones')
+            if observaciones is not None and observaciones.num_rows:
+                st.warning(f"⚠️ {observaciones.num_rows} fila(s) con RUT inválido o repetido: las inválidas "
+                           "quedan fuera de la conciliación y las repetidas se suman por RUT")
+                with st.expander("Ver filas observadas"):
+                    mostrar_vista('conciliacion_observaciones')
+            
+            st.subheader("📊 Resumen por Componente")
+            st.dataframe(conciliacion['resumen'], use_container_width=True)
+            
+            st.subheader("📋 Detalle por Trabajador")
+            mostrar_vista('conciliacion')
+            
+            if os.path.exists(conciliacion['csv']):
+                with open(conciliacion['csv'], 'rb') as archivo_csv:
+                    st.download_button(
+                        label="📥 Descargar Detalle CSV",
+                        data=archivo_csv,
+                        file_name=f"conciliacion_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                        mime="text/csv"
+                    )
+    
+    # TAB 11: LOTES MULTIEMPRESA
+    with tabs[10]:
+        st.header("🏭 Procesamiento de Nóminas Multiempresa")
+        
+        st.info("💡 Sube un archivo de nómina por empresa (el nombre del archivo identifica la empresa) "
+                "o un único archivo consolidado con la columna 'empresa'")
+        
+        archivos_empresas = st.file_uploader("📂 Nóminas por Empresa", type=['xlsx', 'csv', 'parquet'],
+                                             accept_multiple_files=True, key="nominas_empresas")
+        procesos = st.number_input("Procesos en Paralelo", min_value=1, max_value=os.cpu_count() or 1,
+                                   value=os.cpu_count() or 1)
+        
+        if st.button("🏭 Procesar Empresas", use_container_width=True):
+            if not archivos_empresas:
+                st.warning("⚠️ Sube al menos una nómina")
+            else:
+                try:
+                    with tempfile.TemporaryDirectory() as directorio:
+                        archivos = {}
+                        for archivo in archivos_empresas:
+                            ruta = os.path.join(directorio, f"{uuid.uuid4().hex}_{archivo.name}")
+                            with open(ruta, 'wb') as destino:
+                                destino.write(archivo.getbuffer())
+                            archivos[os.path.splitext(archivo.name)[0]] = ruta
+                        
+                        if len(archivos) == 1:
+                            consolidado = leer_nomina(next(iter(archivos.values())))
+                            if 'empresa' in consolidado:
+                                archivos = separar_por_empresa(consolidado, directorio)
+                        
+                        lote = procesar_empresas(archivos, max_procesos=int(procesos), formato='arrow')
+                    
+                    tiempos = lote['tiempos']
+                    met_l1, met_l2, met_l3 = st.columns(3)
+                    with met_l1:
+                        st.metric("Empresas", len(tiempos))
+                    with met_l2:
+                        st.metric("Trabajadores", f"{lote['resultados'].num_rows:,}")
+                    with met_l3:
+                        st.metric("Tiempo Total", f"{lote['segundos_total']:.2f} s")
+                    
+                    st.subheader("⏱️ Tiempos por Empresa")
+                    st.dataframe(tiempos, use_container_width=True)
+                    
+                    st.subheader("📊 Totales por Empresa")
+                    st.dataframe(lote['resultados'].group_by('empresa').aggregate(
+                        [('base_imponible', 'sum'), ('liquido', 'sum')]), use_container_width=True)
+                    
+                    sello = datetime.now().strftime('%Y%m%d_%H%M')
+                    desc_col1, desc_col2 = st.columns(2)
+                    with desc_col1:
+                        st.download_button(
+                            label="📥 Descargar Liquidaciones Parquet",
+                            data=tabla_a_bytes(lote['resultados'], 'parquet'),
+                            file_name=f"liquidaciones_multiempresa_{sello}.parquet",
+                            mime="application/octet-stream"
+                        )
+                    with desc_col2:
+                        st.download_button(
+                            label="📥 Descargar Liquidaciones CSV",
+                            data=tabla_a_bytes(lote['resultados'], 'csv'),
+                            file_name=f"liquidaciones_multiempresa_{sello}.csv",
+                            mime="text/csv"
+                        )
+                except Exception as e:
+                    st.error(f"❌ Error procesando empresas: {str(e)}")
+    
+    # TAB 12: ASISTENCIA Y HORAS EXTRA
+    with tabs[11]:
+        st.header("⏱️ Horas Extra desde Marcaciones de Asistencia")
+        
+        st.info("💡 Sube el registro de marcaciones (CSV: rut, fecha_hora, tipo entrada/salida, en orden "
+                "cronológico) y la nómina del período (rut, sueldo_bruto, afp, isapre y opcionalmente "
+                "jornada_semanal)")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            archivo_marcaciones = st.file_uploader("📂 Marcaciones (CSV)", type=['csv'], key="marcaciones")
+        with col2:
+            archivo_nomina_asistencia = st.file_uploader("📂 Nómina del Período", type=['xlsx', 'csv'],
+                                                         key="nomina_asistencia")
+        
+        gratificacion_asistencia = st.checkbox("Calcular gratificación legal Art. 50 en las liquidaciones",
+                                               key="grat_asistencia")
+        st.caption(f"Jornada ordinaria por defecto: {IND['jornada_semanal']} horas semanales | "
+                   f"Recargo legal: {RECARGO_HORAS_EXTRA * 100:.0f}%")
+        
+        if st.button("⏱️ Calcular Horas Extra y Liquidaciones", use_container_width=True):
+            if archivo_marcaciones is None or archivo_nomina_asistencia is None:
+                st.warning("⚠️ Sube las marcaciones y la nómina")
+            else:
+                try:
+                    inicio = time.perf_counter()
+                    if archivo_nomina_asistencia.name.endswith('.csv'):
+                        nomina_asistencia = pd.read_csv(archivo_nomina_asistencia, dtype={'rut': str})
+                    else:
+                        nomina_asistencia = pd.read_excel(archivo_nomina_asistencia, dtype={'rut': str})
+                    
+                    semanas, anomalias = agregar_marcaciones(archivo_marcaciones)
+                    horas = calcular_horas_extra(semanas, nomina_asistencia)
+                    liquidaciones = MotorFinanciero().calcular_liquidacion_lote(
+                        aplicar_horas_extra(nomina_asistencia, horas),
+                        regimen_gratificacion='art50' if gratificacion_asistencia else None,
+                        formato='arrow')
+                    duracion = time.perf_counter() - inicio
+                    
+                    met_h1, met_h2, met_h3, met_h4 = st.columns(4)
+                    with met_h1:
+                        st.metric("Horas Extra Totales", f"{horas['horas_extra'].sum():,.1f}")
+                    with met_h2:
+                        st.metric("Monto Horas Extra", f"${horas['monto_horas_extra'].sum():,.0f}")
+                    with met_h3:
+                        st.metric("Marcaciones Anómalas", sum(anomalias.values()),
+                                  help=", ".join(f"{causa}: {n}" for causa, n in anomalias.items()))
+                    with met_h4:
+                        st.metric("Tiempo", f"{duracion:.2f} s")
+                    
+                    st.subheader("📋 Horas por Trabajador")
+                    st.dataframe(horas, use_container_width=True)
+                    
+                    st.subheader("💰 Liquidaciones con Horas Extra")
+                    st.dataframe(liquidaciones, use_container_width=True)
+                    st.download_button(
+                        label="📥 Descargar Liquidaciones Parquet",
+                        data=tabla_a_bytes(liquidaciones, 'parquet'),
+                        file_name=f"liquidaciones_asistencia_{datetime.now().strftime('%Y%m%d_%H%M')}.parquet",
+                        mime="application/octet-stream"
+                    )
+                except Exception as e:
+                    st.error(f"❌ Error procesando marcaciones: {str(e)}")
+    
+    # Estado de la caché tras los cálculos de esta ejecución
+    stats_cache = obtener_cache_resultados().estadisticas()
+    with panel_cache.container():
+        st.metric("Aciertos (hits)", stats_cache['aciertos'])
+        st.metric("Fallos (misses)", stats_cache['fallos'])
+        st.metric("Desalojos", stats_cache['desalojos'] + stats_cache['expirados'])
+        st.caption(f"Entradas: {stats_cache['entradas']}/{stats_cache['max_entradas']} | "
+                   f"Tasa de aciertos: {stats_cache['tasa_aciertos']:.1f}% | "
+                   f"Invalidaciones: {stats_cache['invalidaciones']}")
     
     # Footer
     st.markdown("---")